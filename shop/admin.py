@@ -1,7 +1,22 @@
+from datetime import datetime, timedelta
+
 from django.contrib import admin
-from shop.models import WechatUser, Tag, Goods, Order
+from shop.models import (
+    WechatUser, Tag, Goods, Order, OrderItem, PaymentNotification, DailySales
+)
 from django import forms
+from django.core.exceptions import PermissionDenied
 from django.db import models
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from shop.export import EXPORT_FORMATS, iter_order_rows
+from shop.pagination import EstimatedCountPaginator
+from shop.rollups import (
+    ROLLUP_STATUSES, record_transition, sales_report, stamp_transitions
+)
+from shop.stock import set_stock
 
 
 @admin.register(WechatUser)
@@ -47,16 +62,16 @@ class TagAdmin(admin.ModelAdmin):
 @admin.register(Goods)
 class GoodsAdmin(admin.ModelAdmin):
     """商品管理界面配置"""
-    list_display = ('name', 'tag', 'price', 'is_active', 'created_at')
+    list_display = ('name', 'tag', 'price', 'stock', 'is_active', 'created_at')
     list_filter = ('is_active', 'tag', 'created_at')
     search_fields = ('name', 'desc', 'tags')
     ordering = ('-created_at',)
-    list_editable = ('is_active', 'price')
+    list_editable = ('is_active', 'price', 'stock')
     readonly_fields = ('created_at', 'updated_at')
 
     fieldsets = (
         ('基本信息', {
-            'fields': ('name', 'tag', 'price', 'is_active', 'url')
+            'fields': ('name', 'tag', 'price', 'stock', 'is_active', 'url')
         }),
         ('商品描述', {
             'fields': ('desc',)
@@ -74,24 +89,81 @@ class GoodsAdmin(admin.ModelAdmin):
             attrs={'rows': 4, 'cols': 40})}
     }
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # 修改库存时重新分配库存分片
+        if 'stock' in form.changed_data:
+            set_stock(obj.id, obj.stock)
+
+
+class CreatedMonthListFilter(admin.SimpleListFilter):
+    """
+    按月筛选订单（替代 date_hierarchy）
+    月份选项在内存中生成，不对订单表做 SELECT DISTINCT 日期扫描
+    """
+    title = '下单月份'
+    parameter_name = 'created_month'
+    months = 12
+
+    def lookups(self, request, model_admin):
+        today = timezone.localdate()
+        year, month = today.year, today.month
+        choices = []
+        for _ in range(self.months):
+            choices.append((f'{year}-{month:02d}', f'{year}年{month}月'))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        return choices
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            year, month = (int(part) for part in self.value().split('-'))
+            start = timezone.make_aware(datetime(year, month, 1))
+        except ValueError:
+            return queryset
+        if month == 12:
+            end = start.replace(year=year + 1, month=1)
+        else:
+            end = start.replace(month=month + 1)
+        return queryset.filter(created_at__gte=start, created_at__lt=end)
+
+
+class OrderItemInline(admin.TabularInline):
+    """订单明细内联配置"""
+    model = OrderItem
+    extra = 0
+    fields = ('goods', 'quantity', 'price', 'total_amount')
+    readonly_fields = ('goods', 'quantity', 'price', 'total_amount')
+    can_delete = False
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     """订单管理界面配置"""
+    inlines = (OrderItemInline,)
     list_display = (
         'order_number', 'user', 'goods', 'quantity', 'total_amount',
-        'status', 'created_at'
+        'status', 'refund_required', 'created_at'
     )
-    list_filter = ('status', 'payment_method', 'created_at')
+    list_filter = (
+        'status', 'refund_required', 'payment_method', CreatedMonthListFilter,
+        'created_at'
+    )
+    # 只走索引：订单号/交易号精确匹配，手机号前缀匹配
     search_fields = (
-        'order_number', 'user__username', 'user__nickname',
-        'goods__name', 'receiver_name', 'receiver_phone'
+        '=order_number', '^receiver_phone', '=transaction_id'
     )
+    search_help_text = '输入完整订单号、微信交易号或手机号前缀'
     ordering = ('-created_at',)
+    list_select_related = ('user', 'goods')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = (
         'order_number', 'total_amount', 'created_at', 'paid_at',
-        'completed_at', 'transaction_id'
+        'completed_at', 'cancelled_at', 'transaction_id'
     )
+    actions = ('export_csv', 'export_jsonl')
 
     fieldsets = (
         ('订单信息', {
@@ -106,10 +178,114 @@ class OrderAdmin(admin.ModelAdmin):
         }),
         ('状态信息', {
             'fields': (
-                'status', 'payment_method', 'prepay_id', 'transaction_id'
+                'status', 'refund_required', 'payment_method', 'prepay_id',
+                'prepay_expires_at', 'transaction_id'
             )
         }),
         ('时间信息', {
-            'fields': ('created_at', 'paid_at', 'completed_at')
+            'fields': (
+                'created_at', 'paid_at', 'completed_at', 'cancelled_at'
+            )
         }),
     )
+
+    def save_model(self, request, obj, form, change):
+        # 手工修改状态：补齐支付/完成/取消时间并累加销售日汇总
+        transitions = []
+        if change and 'status' in form.changed_data:
+            transitions = stamp_transitions(obj)
+        super().save_model(request, obj, form, change)
+        for status, when in transitions:
+            record_transition([obj.id], status, when)
+
+    def get_search_results(self, request, queryset, search_term):
+        """按输入内容路由到单个索引列，避免多列 OR/LIKE 扫描"""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.upper().startswith('ORD'):
+            return queryset.filter(order_number=term), False
+        if term.isdigit() and len(term) <= 11:
+            return queryset.filter(receiver_phone__startswith=term), False
+        return queryset.filter(
+            Q(order_number=term) | Q(transaction_id=term)
+        ), False
+
+    def _export(self, queryset, fmt):
+        """按当前筛选条件（或所选订单）流式导出"""
+        encode, content_type = EXPORT_FORMATS[fmt]
+        response = StreamingHttpResponse(
+            encode(iter_order_rows(queryset)), content_type=content_type
+        )
+        filename = f"orders-{timezone.now():%Y%m%d%H%M%S}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='导出所选订单（CSV）')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='导出所选订单（JSONL）')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
+
+
+@admin.register(PaymentNotification)
+class PaymentNotificationAdmin(admin.ModelAdmin):
+    """支付回调队列管理界面配置"""
+    list_display = (
+        'out_trade_no', 'transaction_id', 'status', 'attempts',
+        'next_attempt_at', 'created_at', 'processed_at'
+    )
+    list_filter = ('status',)
+    search_fields = ('=out_trade_no', '=transaction_id')
+    ordering = ('-id',)
+    readonly_fields = (
+        'out_trade_no', 'transaction_id', 'payload', 'attempts',
+        'last_error', 'created_at', 'processed_at'
+    )
+
+
+@admin.register(DailySales)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    """销售报表：只读取日汇总表，不扫描订单表"""
+    change_list_template = 'admin/shop/sales_dashboard.html'
+    periods = (7, 30, 90)
+    top_limit = 20
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', self.periods[0]))
+        except ValueError:
+            days = self.periods[0]
+        if days not in self.periods:
+            days = self.periods[0]
+        end = timezone.localdate()
+        start = end - timedelta(days=days - 1)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': '销售报表',
+            'periods': self.periods,
+            'days': days,
+            'start': start,
+            'end': end,
+            'statuses': [
+                (status, label) for status, label
+                in DailySales.STATUS_CHOICES if status in ROLLUP_STATUSES
+            ],
+            **sales_report(start, end, self.top_limit),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, self.change_list_template, context)
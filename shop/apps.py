@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BusinessCardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        from shop import signals  # noqa: F401
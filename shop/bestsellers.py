@@ -0,0 +1,210 @@
+"""
+热销榜
+
+支付确认时在同一事务中把销量累加到当前小时的 SalesBucket，
+并累加到每个时间窗口（24h/7d/30d）的 BestSeller 行；已支付订单被取消时
+从支付时所在的小时桶和尚未滑出的窗口中扣除；
+定时任务（maintain_best_sellers）把滑出窗口的小时销量从 BestSeller 中扣除。
+读取榜单是一次 (period[, tag], quantity) 索引上的 LIMIT k 扫描
+加一次按主键取商品数据，与订单量无关。
+窗口以小时为粒度，实际覆盖的时间比窗口长不超过一小时加任务间隔。
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from shop.models import BestSeller, BestSellerWindow, Goods, SalesBucket
+from shop.serializers import GOODS_PROJECTOR
+
+
+# 时间窗口名称 -> 小时数
+BEST_SELLER_WINDOWS = getattr(settings, 'BEST_SELLER_WINDOWS', {
+    '24h': 24,
+    '7d': 24 * 7,
+    '30d': 24 * 30,
+})
+BEST_SELLERS_MAX_LIMIT = getattr(settings, 'BEST_SELLERS_MAX_LIMIT', 50)
+
+
+def bucket_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def window_start(period, now=None):
+    """窗口内最早的小时桶"""
+    return bucket_hour(now or timezone.now()) - timedelta(
+        hours=BEST_SELLER_WINDOWS[period]
+    )
+
+
+def _increment(model, lookup, tag_id, quantity):
+    # 同时更新标签，商品换标签后按标签筛选的榜单随之更新
+    increments = {'quantity': F('quantity') + quantity, 'tag_id': tag_id}
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, tag_id=tag_id, quantity=quantity)
+    except IntegrityError:
+        # 并发事务已插入该行
+        model.objects.filter(**lookup).update(**increments)
+
+
+def _merge(lines):
+    """按商品合并明细，返回按商品ID排序的 [(商品ID, (标签ID, 件数))]"""
+    sold = {}
+    for goods_id, tag_id, quantity, _ in lines:
+        entry = sold.setdefault(goods_id, [tag_id, 0])
+        entry[1] += quantity
+    return sorted(sold.items())
+
+
+def record_sales(lines, when=None):
+    """
+    累加已支付订单明细的销量，需在订单状态更新的事务中调用
+    lines 为 [(商品ID, 标签ID, 件数, 金额)]
+    一次调用内按 (窗口, 商品) 的固定顺序加锁；同一事务中多次调用时
+    加锁顺序不再有序，可能与过期扣除死锁，因此每个事务只应记录一次支付
+    （支付回调逐条提交，见 shop.notifications.process_batch）
+    """
+    now = timezone.now()
+    hour = bucket_hour(when or now)
+    sold = _merge(lines)
+
+    for goods_id, (tag_id, quantity) in sold:
+        _increment(
+            SalesBucket, {'hour': hour, 'goods_id': goods_id},
+            tag_id, quantity
+        )
+    for period in BEST_SELLER_WINDOWS:
+        # 早于窗口的销量（补记的历史支付）不计入，否则永远不会被扣除
+        if hour < window_start(period, now):
+            continue
+        for goods_id, (tag_id, quantity) in sold:
+            _increment(
+                BestSeller, {'period': period, 'goods_id': goods_id},
+                tag_id, quantity
+            )
+
+
+def remove_sales(lines, paid_at):
+    """
+    扣除已支付后又被取消的订单销量，需在取消订单的事务中调用
+    paid_at 为原支付时间：从该小时桶扣除，并从尚未扣除该小时的窗口中扣除
+    （已滑出窗口的销量已由过期任务扣除）；锁定窗口状态，与过期扣除串行
+    """
+    hour = bucket_hour(paid_at)
+    sold = _merge(lines)
+    states = BestSellerWindow.objects.select_for_update().in_bulk(
+        list(BEST_SELLER_WINDOWS)
+    )
+    for goods_id, (_, quantity) in sold:
+        SalesBucket.objects.filter(hour=hour, goods_id=goods_id).update(
+            quantity=F('quantity') - quantity
+        )
+    goods_ids = [goods_id for goods_id, _ in sold]
+    for period in BEST_SELLER_WINDOWS:
+        state = states.get(period)
+        # 窗口尚未初始化时，首次维护会按小时桶重新汇总
+        if state is None or hour < state.expired_before:
+            continue
+        for goods_id, (_, quantity) in sold:
+            BestSeller.objects.filter(
+                period=period, goods_id=goods_id
+            ).update(quantity=F('quantity') - quantity)
+        BestSeller.objects.filter(
+            period=period, goods_id__in=goods_ids, quantity__lte=0
+        ).delete()
+
+
+def _rebuild_window(period, start):
+    BestSeller.objects.filter(period=period).delete()
+    rows = (
+        SalesBucket.objects.filter(hour__gte=start)
+        .values('goods_id')
+        .annotate(total=Sum('quantity'), tag_id=Max('tag_id'))
+        .order_by()
+    )
+    BestSeller.objects.bulk_create([
+        BestSeller(
+            period=period, goods_id=row['goods_id'], tag_id=row['tag_id'],
+            quantity=row['total']
+        )
+        for row in rows if row['total'] > 0
+    ], batch_size=1000)
+
+
+def expire_windows(now=None, rebuild=False):
+    """
+    从各窗口扣除滑出窗口的小时销量，删除所有窗口都已扣除的小时桶
+    窗口首次运行或 rebuild 时按小时桶重新汇总该窗口
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        states = BestSellerWindow.objects.select_for_update().in_bulk(
+            list(BEST_SELLER_WINDOWS)
+        )
+        for period in BEST_SELLER_WINDOWS:
+            start = window_start(period, now)
+            state = states.get(period)
+            if state is None or rebuild:
+                _rebuild_window(period, start)
+                states[period] = BestSellerWindow.objects.update_or_create(
+                    period=period, defaults={'expired_before': start}
+                )[0]
+                continue
+            if state.expired_before >= start:
+                continue
+            expired = (
+                SalesBucket.objects
+                .filter(hour__gte=state.expired_before, hour__lt=start)
+                .values('goods_id')
+                .annotate(total=Sum('quantity'))
+                .order_by('goods_id')
+            )
+            for row in expired:
+                BestSeller.objects.filter(
+                    period=period, goods_id=row['goods_id']
+                ).update(quantity=F('quantity') - row['total'])
+            BestSeller.objects.filter(period=period, quantity__lte=0).delete()
+            state.expired_before = start
+            state.save(update_fields=['expired_before'])
+
+        oldest = min(state.expired_before for state in states.values())
+        SalesBucket.objects.filter(hour__lt=oldest).delete()
+
+
+def best_sellers(period, tag_id=None, limit=20):
+    """
+    热销榜：按窗口内销量倒序的商品数据，附带销量 sold
+    多取一些排名以跳过已下架的商品
+    """
+    ranking = BestSeller.objects.filter(period=period)
+    if tag_id is not None:
+        ranking = ranking.filter(tag_id=tag_id)
+    ranking = list(
+        ranking.order_by('-quantity', '-goods_id')
+        .values_list('goods_id', 'quantity')[:limit * 2]
+    )
+    goods = {
+        row[0]: row for row in GOODS_PROJECTOR.values(
+            Goods.objects.filter(
+                id__in=[goods_id for goods_id, _ in ranking], is_active=True
+            ).order_by()
+        )
+    }
+    project = GOODS_PROJECTOR.project
+    result = []
+    for goods_id, quantity in ranking:
+        row = goods.get(goods_id)
+        if row is None:
+            continue
+        item = project(row)
+        item['sold'] = quantity
+        result.append(item)
+        if len(result) == limit:
+            break
+    return result
@@ -0,0 +1,93 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from shop.db_router import CATALOG_SCOPE, pin_primary
+from shop.serializers import dumps
+
+
+CATALOG_VERSION_KEY = 'shop:catalog:version'
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _initial_version():
+    # 版本号丢失（缓存重启/淘汰）后以毫秒时间戳重新起步，避免命中旧版本的残留数据
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    """获取当前商品目录版本号"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """商品目录变更后递增版本号，旧版本缓存自然失效"""
+    # 副本追上之前从主库读取，避免旧数据写入新版本的缓存
+    pin_primary(CATALOG_SCOPE)
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = _initial_version()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def catalog_cache_key(name, *parts):
+    """按目录版本号生成缓存键"""
+    suffix = ':'.join(str(part) for part in parts)
+    return f'shop:catalog:{get_catalog_version()}:{name}:{suffix}'
+
+
+def cached_json_response(name, build, *parts):
+    """
+    返回缓存的 JSON 响应
+    缓存内容为序列化后的响应字节，命中时不访问数据库也不再做 JSON 编码
+    """
+    key = catalog_cache_key(name, *parts)
+    content = cache.get(key)
+    if content is None:
+        content = dumps(build())
+        cache.set(key, content, CATALOG_CACHE_TIMEOUT)
+    return HttpResponse(content, content_type='application/json')
+
+
+def catalog_condition(name, aggregate, get_parts=None):
+    """
+    为目录接口加上条件请求支持（ETag / Last-Modified / 304）
+    aggregate(*parts) 返回 {'count': 条数, 'last_modified': 最大 updated_at}；
+    校验值按目录版本缓存，命中 If-None-Match/If-Modified-Since 时
+    直接返回 304，不查询数据库也不生成响应体
+    """
+    def validators(request):
+        memo = getattr(request, '_catalog_validators', None)
+        if memo is not None:
+            return memo
+        parts = get_parts(request) if get_parts else ()
+        key = catalog_cache_key(f'{name}:validators', *parts)
+        memo = cache.get(key)
+        if memo is None:
+            row = aggregate(*parts)
+            last_modified = row['last_modified']
+            stamp = last_modified.timestamp() if last_modified else 0
+            raw = f"{name}|{'|'.join(map(str, parts))}|{row['count']}|{stamp}"
+            etag = hashlib.md5(raw.encode('utf-8')).hexdigest()
+            memo = (etag, last_modified)
+            cache.set(key, memo, CATALOG_CACHE_TIMEOUT)
+        request._catalog_validators = memo
+        return memo
+
+    def etag(request, *args, **kwargs):
+        return validators(request)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validators(request)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
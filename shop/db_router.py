@@ -0,0 +1,160 @@
+"""
+读写分离
+
+写入和事务内的读取始终走主库；标记为只读的接口（商品目录、订单列表）
+的查询在未被“钉住”时随机分配到 DATABASE_REPLICAS 中的只读副本。
+用户发生写入（下单、支付、登录）后，其后 REPLICA_PIN_SECONDS 秒内的读取
+仍走主库，保证读到自己的写入；商品目录变更后同样在该时间窗口内读主库，
+避免把副本上的旧数据按新的目录版本号写入缓存。
+钉住标记保存在缓存中，需配置 Redis 等共享缓存才能在多个 worker 之间生效
+（进程内的 LocMemCache 只对写入所在的 worker 有效）。
+"""
+import functools
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+
+DATABASE_REPLICAS = list(getattr(settings, 'DATABASE_REPLICAS', []))
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+CATALOG_SCOPE = 'catalog'
+
+# 当前请求的路由状态，由 ReplicaRoutingMiddleware 设置
+_state = ContextVar('shop_db_routing', default=None)
+
+
+class RoutingState:
+    """单个请求的路由状态（可变对象，异步视图的线程切换中保持共享）"""
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        self.replica = False
+        self.wrote = False
+
+
+def _pin_key(scope):
+    return f'shop:db:pin:{scope}'
+
+
+def user_scope(openid):
+    return f'user:{openid}'
+
+
+def request_scope(request):
+    """请求所属用户的钉住范围，未携带登录凭证时返回 None"""
+    openid = request.headers.get('Authorization', '').replace('Bearer ', '')
+    return user_scope(openid) if openid else None
+
+
+def pin_primary(*scopes):
+    """在时间窗口内把这些范围的读取钉在主库"""
+    scopes = [scope for scope in scopes if scope]
+    if scopes and DATABASE_REPLICAS:
+        cache.set_many(
+            {_pin_key(scope): 1 for scope in scopes}, REPLICA_PIN_SECONDS
+        )
+
+
+async def apin_primary(*scopes):
+    """pin_primary 的异步版本，供异步视图和中间件使用"""
+    scopes = [scope for scope in scopes if scope]
+    if scopes and DATABASE_REPLICAS:
+        await cache.aset_many(
+            {_pin_key(scope): 1 for scope in scopes}, REPLICA_PIN_SECONDS
+        )
+
+
+def unpin(*scopes):
+    cache.delete_many([_pin_key(scope) for scope in scopes if scope])
+
+
+def is_pinned(*scopes):
+    keys = [_pin_key(scope) for scope in scopes if scope]
+    return bool(keys) and bool(cache.get_many(keys))
+
+
+def replica_reads(get_scopes):
+    """
+    视图装饰器：未被钉住时把视图内的查询路由到只读副本
+    get_scopes(request) 返回需要检查的钉住范围
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = _state.get()
+            if (state is None or not DATABASE_REPLICAS
+                    or is_pinned(*get_scopes(request))):
+                return view(request, *args, **kwargs)
+            state.replica = True
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                state.replica = False
+        return wrapper
+    return decorator
+
+
+class PrimaryReplicaRouter:
+    """主库写、只读接口读副本"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica and DATABASE_REPLICAS:
+            return random.choice(DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库数据相同，跨连接的关联视为同一数据库
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的表结构通过复制同步
+        return db not in DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    为每个请求建立路由状态；请求中发生写入时钉住该用户
+    同时支持同步和异步调用链，异步视图不会被适配成同步执行
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and response.status_code < 500:
+            pin_primary(request_scope(request))
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and response.status_code < 500:
+            await apin_primary(request_scope(request))
+        return response
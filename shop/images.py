@@ -0,0 +1,141 @@
+"""
+商品图片衍生图
+
+商品保存后在后台线程中把原图缩放为缩略图/列表图/详情图，优先编码为 WebP，
+以内容哈希作为文件名保存。文件内容不变则地址不变，可设置长期不可变缓存；
+原图更换后生成新的文件名，客户端自然取到新图。
+"""
+import hashlib
+import io
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from shop.cache import bump_catalog_version
+from shop.models import Goods
+
+
+logger = logging.getLogger(__name__)
+
+# 衍生图名称 -> 最长边像素（按 2 倍屏取值）
+GOODS_IMAGE_SIZES = getattr(settings, 'GOODS_IMAGE_SIZES', {
+    'thumb': 300,
+    'list': 750,
+    'detail': 1500,
+})
+GOODS_IMAGE_QUALITY = getattr(settings, 'GOODS_IMAGE_QUALITY', 80)
+GOODS_IMAGE_WORKERS = getattr(settings, 'GOODS_IMAGE_WORKERS', 2)
+GOODS_IMAGE_CACHE_MAX_AGE = getattr(
+    settings, 'GOODS_IMAGE_CACHE_MAX_AGE', 60 * 60 * 24 * 365
+)
+
+DERIVATIVE_DIR = 'derivatives'
+DERIVATIVE_NAME_RE = re.compile(r'^[0-9a-f]{32}\.(webp|jpg|png)$')
+CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+# 线程在首次提交任务时才创建
+_executor = ThreadPoolExecutor(
+    max_workers=GOODS_IMAGE_WORKERS, thread_name_prefix='goods-images'
+)
+
+
+def _encode(image):
+    """编码单张衍生图，返回 (字节串, 扩展名)"""
+    from PIL import features
+
+    buffer = io.BytesIO()
+    if features.check('webp'):
+        image.save(buffer, 'WEBP', quality=GOODS_IMAGE_QUALITY, method=4)
+        return buffer.getvalue(), 'webp'
+    if image.mode == 'RGBA':
+        image.save(buffer, 'PNG', optimize=True)
+        return buffer.getvalue(), 'png'
+    image.save(
+        buffer, 'JPEG', quality=GOODS_IMAGE_QUALITY,
+        optimize=True, progressive=True
+    )
+    return buffer.getvalue(), 'jpg'
+
+
+def derivative_url(name):
+    """衍生图的完整访问地址"""
+    return f"{settings.SITE_DOMAIN}{reverse('goods_image', args=[name])}"
+
+
+def generate_derivatives(source_name):
+    """
+    为原图生成各尺寸衍生图，返回 {尺寸名称: 地址}
+    只读写文件存储、不访问数据库，可在子进程中执行
+    """
+    from PIL import Image, ImageOps
+
+    with default_storage.open(source_name, 'rb') as source:
+        original = Image.open(source)
+        original = ImageOps.exif_transpose(original)
+        has_alpha = (
+            original.mode in ('RGBA', 'LA')
+            or 'transparency' in original.info
+        )
+        original = original.convert('RGBA' if has_alpha else 'RGB')
+
+    images = {}
+    for size_name, size in GOODS_IMAGE_SIZES.items():
+        image = original.copy()
+        # thumbnail 只缩小不放大，保持宽高比
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        content, extension = _encode(image)
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        name = f'{digest}.{extension}'
+        path = f'{DERIVATIVE_DIR}/{name}'
+        # 文件名即内容哈希，已存在时无需重复写入
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+        images[size_name] = derivative_url(name)
+    return images
+
+
+def store_derivatives(goods_id, source_name, images):
+    """
+    保存衍生图地址
+    仅当商品原图仍为 source_name 时更新，避免覆盖期间新上传的图片
+    """
+    updated = Goods.objects.filter(id=goods_id, url=source_name).update(
+        images=images, images_source=source_name, updated_at=timezone.now()
+    )
+    if updated:
+        # update() 不触发信号，手动使目录缓存和搜索索引失效
+        bump_catalog_version()
+    return updated
+
+
+def build_goods_images(goods_id, source_name):
+    """生成并保存单个商品的衍生图（后台线程中执行）"""
+    try:
+        images = generate_derivatives(source_name)
+        store_derivatives(goods_id, source_name, images)
+    except Exception:
+        logger.exception('商品 %s 衍生图生成失败: %s', goods_id, source_name)
+    finally:
+        connection.close()
+
+
+def schedule_goods_images(goods):
+    """原图与已生成的衍生图不一致时，在事务提交后提交后台生成任务"""
+    source_name = goods.url.name if goods.url else None
+    if not source_name or source_name == goods.images_source:
+        return
+    goods_id = goods.id
+    transaction.on_commit(
+        lambda: _executor.submit(build_goods_images, goods_id, source_name)
+    )
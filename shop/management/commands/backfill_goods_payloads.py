@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.cache import bump_catalog_version
+from shop.models import Goods
+
+
+class Command(BaseCommand):
+    help = '为已有商品生成结构化标签与图片地址（修改 SITE_DOMAIN 或标签主题后也需执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='每批更新的商品数量')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Goods.objects.only(
+            'id', 'tags', 'url', 'images_source'
+        ).order_by('id')
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            now = timezone.now()
+            for good in batch:
+                good.refresh_derived_fields()
+                # 接口数据变化，同步更新时间使客户端的 ETag 失效
+                good.updated_at = now
+            Goods.objects.bulk_update(
+                batch, ['tag_list', 'image_url', 'updated_at']
+            )
+            total += len(batch)
+            last_id = batch[-1].id
+        # bulk_update 不触发信号，手动使目录缓存失效
+        bump_catalog_version()
+        self.stdout.write(f'updated {total} goods')
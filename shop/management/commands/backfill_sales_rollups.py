@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop.rollups import rebuild_rollups
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'日期格式错误: {value}（应为 YYYY-MM-DD）')
+
+
+class Command(BaseCommand):
+    help = (
+        '按订单数据重建销售日汇总（按主键分段读取订单）；'
+        '默认重建今天之前的全部日期，今天的汇总保持增量累加的结果'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='起始日期（含），YYYY-MM-DD')
+        parser.add_argument('--until',
+                            help='截止日期（不含），YYYY-MM-DD，默认今天')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='每段读取的订单数')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='分段之间的暂停（秒）')
+
+    def handle(self, *args, **options):
+        start = parse_date(options['start']) if options['start'] else None
+        until = parse_date(options['until']) if options['until'] else None
+        if start and until and start >= until:
+            raise CommandError('起始日期必须早于截止日期')
+        if until and until > timezone.localdate():
+            raise CommandError('截止日期不能晚于今天，今天的汇总由增量累加维护')
+
+        def progress(scanned):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'scanned {scanned} orders')
+
+        scanned = rebuild_rollups(
+            start=start, until=until, chunk_size=options['chunk_size'],
+            pause=options['pause'], progress=progress
+        )
+        self.stdout.write(f'rebuilt sales rollups from {scanned} orders')
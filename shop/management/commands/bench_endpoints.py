@@ -0,0 +1,402 @@
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import httpx
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.models import F
+from django.utils import timezone
+
+from shop import payments, wechat
+from shop.models import Goods, Order, Tag, WechatUser
+from shop.rollups import PAID_STATUSES
+from shop.wechat_stub import WechatStubServer
+
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'bench_baseline.json')
+QUERY_COUNT_HEADER = 'X-Bench-Queries'
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def counting_application(application):
+    """在响应头中带回本次请求执行的 SQL 数量"""
+    def app(environ, start_response):
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        def counted_start_response(status, headers, exc_info=None):
+            headers.append((QUERY_COUNT_HEADER, str(count[0])))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(counter):
+            return application(environ, counted_start_response)
+    return app
+
+
+def percentile(sorted_values, q):
+    """最近秩百分位"""
+    index = max(0, min(len(sorted_values) - 1,
+                       round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        '接口压测：在 SQLite 上启动应用和微信桩服务，并发请求各接口，'
+        '输出吞吐量、p50/p95/p99 延迟和每请求 SQL 数，并与基线对比'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='每个接口的请求数')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='并发连接数')
+        parser.add_argument('--goods', type=int, default=2000,
+                            help='种子商品数')
+        parser.add_argument('--users', type=int, default=500,
+                            help='种子用户数')
+        parser.add_argument('--orders', type=int, default=20000,
+                            help='种子订单数')
+        parser.add_argument('--only', nargs='+', default=None,
+                            help='只压测指定接口')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                            help='基线文件路径')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='把本次结果保存为基线')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='p95/p99 延迟超过基线该比例时给出提示（不判定失败）')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='随机数种子')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                '基准测试只能在 SQLite 上运行: '
+                'DJANGO_SETTINGS_MODULE=shop_admin.settings_bench'
+            )
+        if (not options['save_baseline']
+                and not os.path.exists(options['baseline'])):
+            raise CommandError(
+                f"基线文件不存在: {options['baseline']}，"
+                '请先使用 --save-baseline 生成'
+            )
+        random.seed(options['seed'])
+        self.prepare_database()
+        self.fixtures = self.seed(
+            options['goods'], options['users'], options['orders']
+        )
+
+        stub = WechatStubServer().start()
+        wechat.WECHAT_API_BASE = stub.url
+        wechat.WECHAT_PAY_API_BASE = stub.url
+        server = ThreadedWSGIServer(
+            ('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=True
+        )
+        server.set_app(counting_application(get_wsgi_application()))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        scenarios = self.scenarios()
+        if options['only']:
+            unknown = set(options['only']) - set(scenarios)
+            if unknown:
+                raise CommandError(f"未知接口: {', '.join(sorted(unknown))}")
+            scenarios = {k: scenarios[k] for k in options['only']}
+
+        results = {}
+        try:
+            for name, build in scenarios.items():
+                results[name] = self.run_scenario(
+                    base_url, build, options['requests'],
+                    options['concurrency']
+                )
+                self.report(name, results[name])
+        finally:
+            server.shutdown()
+            server.server_close()
+            # 等待后台预下单完成，避免进程退出时任务被中断
+            wechat.shutdown()
+            stub.stop()
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"baseline saved to {options['baseline']}")
+            return
+        self.compare(results, options['baseline'], options['tolerance'])
+
+    def prepare_database(self):
+        connections.close_all()
+        name = connection.settings_dict['NAME']
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(f'{name}{suffix}'):
+                os.remove(f'{name}{suffix}')
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        with connection.cursor() as cursor:
+            # WAL 模式下读写互不阻塞，更接近线上数据库的并发特性
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+    def seed(self, goods_count, user_count, order_count):
+        tags = Tag.objects.bulk_create([
+            Tag(name=f'标签{i}', sequence=i) for i in range(20)
+        ])
+        words = ['新鲜', '有机', '进口', '精选', '特价', '礼盒', '家庭装', '当季']
+        goods = Goods.objects.bulk_create([
+            Goods(
+                name=f'{random.choice(words)}商品{i}',
+                price=Decimal(random.randint(100, 99900)) / 100,
+                tag=tags[i % len(tags)],
+                desc=' '.join(random.sample(words, 4)) * 10,
+                tags=','.join(random.sample(words, 2)),
+                tag_list=[], is_active=i % 10 != 0,
+            )
+            for i in range(goods_count)
+        ])
+        goods = [g for g in goods if g.is_active]
+        users = WechatUser.objects.bulk_create([
+            WechatUser(openid=f'bench-user-{i}') for i in range(user_count)
+        ])
+        statuses = ['pending', 'paid', 'shipped', 'completed', 'cancelled']
+        now = timezone.now()
+
+        def paid_at(status):
+            # 已支付的订单分布在最近 29 天的整点之前，回填只统计当前小时之前的销量
+            if status not in PAID_STATUSES:
+                return None
+            return now - timedelta(
+                hours=random.randint(1, 29 * 24),
+                minutes=random.randint(0, 59)
+            )
+
+        orders = Order.objects.bulk_create([
+            Order(
+                order_number=f'BENCH{i:015d}',
+                user=users[i % user_count],
+                goods=goods[i % len(goods)],
+                quantity=1,
+                total_amount=goods[i % len(goods)].price,
+                receiver_name='张三',
+                receiver_phone=f'138{i:08d}',
+                receiver_address='北京市朝阳区',
+                status=status,
+                paid_at=paid_at(status),
+            )
+            for i, status in enumerate(
+                statuses[i % len(statuses)] for i in range(order_count)
+            )
+        ])
+        # created_at 由 auto_now_add 写入当前时间，已支付的订单改为支付时间
+        Order.objects.filter(paid_at__isnull=False).update(
+            created_at=F('paid_at')
+        )
+        # 批量写入的订单不经过状态迁移，按订单数据生成热销榜
+        call_command('maintain_best_sellers', backfill=True, stdout=StringIO())
+        return {
+            'tags': [t.id for t in tags],
+            'goods': [g.id for g in goods],
+            'users': [u.openid for u in users],
+            'pending': [
+                (o.id, o.order_number, o.user.openid)
+                for o in orders if o.status == 'pending'
+            ],
+        }
+
+    def scenarios(self):
+        """接口名称 -> 生成第 i 个请求 (method, path, kwargs) 的函数"""
+        fixtures = self.fixtures
+        receiver = {
+            'receiver_name': '张三',
+            'receiver_phone': '13800000000',
+            'receiver_address': '北京市朝阳区',
+        }
+
+        def auth(openid):
+            return {'Authorization': f'Bearer {openid}'}
+
+        def login(i):
+            return 'POST', '/api/wechat-login/', {
+                'json': {'code': f'bench-{i}'}
+            }
+
+        def tags(i):
+            return 'GET', '/api/tags/', {}
+
+        def goods(i):
+            return 'GET', '/api/goods/', {
+                'params': {'tag_id': random.choice(fixtures['tags'])}
+            }
+
+        def search(i):
+            return 'GET', '/api/goods/search/', {
+                'params': {'q': random.choice(['新鲜', '有机 礼盒', '特价'])}
+            }
+
+        def best_sellers(i):
+            params = {'period': random.choice(['24h', '7d', '30d'])}
+            if i % 2:
+                params['tag_id'] = random.choice(fixtures['tags'])
+            return 'GET', '/api/goods/best-sellers/', {'params': params}
+
+        def create_order(i):
+            return 'POST', '/api/orders/create/', {
+                'json': {'goods_id': random.choice(fixtures['goods']),
+                         **receiver},
+                'headers': auth(random.choice(fixtures['users'])),
+            }
+
+        def get_orders(i):
+            return 'GET', '/api/orders/', {
+                'headers': auth(random.choice(fixtures['users']))
+            }
+
+        def pay(i):
+            order_id, _, openid = random.choice(fixtures['pending'])
+            return 'POST', '/api/wechat-pay/', {
+                'json': {'order_id': order_id}, 'headers': auth(openid)
+            }
+
+        def notify(i):
+            _, order_number, _ = random.choice(fixtures['pending'])
+            params = {
+                'return_code': 'SUCCESS',
+                'result_code': 'SUCCESS',
+                'out_trade_no': order_number,
+                'transaction_id': f'BENCHTX{i:012d}',
+            }
+            body = ''.join(f'<{k}>{v}</{k}>' for k, v in params.items())
+            return 'POST', '/api/wechat-pay-notify/', {
+                'content': (
+                    f'<xml>{body}<sign>{payments.sign(params)}</sign></xml>'
+                ),
+                'headers': {'Content-Type': 'application/xml'},
+            }
+
+        return {
+            'login': login,
+            'tags': tags,
+            'goods': goods,
+            'search': search,
+            'best_sellers': best_sellers,
+            'create_order': create_order,
+            'get_orders': get_orders,
+            'pay': pay,
+            'notify': notify,
+        }
+
+    def run_scenario(self, base_url, build, total, concurrency):
+        requests = [build(i) for i in range(total)]
+        latencies = []
+        queries = []
+        errors = [0]
+        lock = threading.Lock()
+        cursor = iter(range(total))
+
+        def worker():
+            with httpx.Client(base_url=base_url, timeout=30) as client:
+                while True:
+                    with lock:
+                        index = next(cursor, None)
+                    if index is None:
+                        return
+                    method, path, kwargs = requests[index]
+                    started = time.perf_counter()
+                    try:
+                        response = client.request(method, path, **kwargs)
+                        ok = response.status_code < 400
+                        count = int(response.headers.get(
+                            QUERY_COUNT_HEADER, 0
+                        ))
+                    except httpx.HTTPError:
+                        ok, count = False, 0
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        queries.append(count)
+                        if not ok:
+                            errors[0] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': total,
+            'rps': round(total / wall, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries': round(statistics.mean(queries), 2),
+            'error_rate': round(errors[0] / total, 4),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<14} {result['rps']:>8.1f} req/s  "
+            f"p50 {result['p50_ms']:>7.2f}ms  "
+            f"p95 {result['p95_ms']:>7.2f}ms  "
+            f"p99 {result['p99_ms']:>7.2f}ms  "
+            f"{result['queries']:>5.2f} queries/req  "
+            f"errors {result['error_rate']:.2%}"
+        )
+
+    def compare(self, results, path, tolerance):
+        """
+        与基线对比：每请求 SQL 数和错误率与机器无关，超出基线判定为回归；
+        单次运行的延迟分位数受机器负载影响，超出基线只作提示
+        """
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        regressions = []
+        slower = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            # 缓存命中率会让平均 SQL 数略有波动，每请求多出半条以上才算回归
+            if result['queries'] > base['queries'] + 0.5:
+                regressions.append(
+                    f"{name}: queries/req {base['queries']} -> "
+                    f"{result['queries']}"
+                )
+            if result['error_rate'] > base['error_rate']:
+                regressions.append(
+                    f"{name}: error rate {base['error_rate']:.2%} -> "
+                    f"{result['error_rate']:.2%}"
+                )
+            for key in ('p95_ms', 'p99_ms'):
+                if result[key] > base[key] * (1 + tolerance):
+                    slower.append(
+                        f'{name}: {key} {base[key]} -> {result[key]}'
+                    )
+
+        for message in slower:
+            self.stdout.write(self.style.WARNING(f'SLOWER {message}'))
+        for message in regressions:
+            self.stderr.write(f'REGRESSION {message}')
+        if regressions:
+            raise CommandError(f'{len(regressions)} 项性能回归')
+        self.stdout.write(self.style.SUCCESS('no regressions against baseline'))
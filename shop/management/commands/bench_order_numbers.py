@@ -0,0 +1,71 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import order_number
+
+
+def _generate(count):
+    next_id = order_number.next_order_number
+    return [next_id() for _ in range(count)]
+
+
+def _worker(args):
+    count, threads = args
+    per_thread = count // threads
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        batches = list(pool.map(_generate, [per_thread] * threads))
+    elapsed = time.perf_counter() - started
+    ids = [i for batch in batches for i in batch]
+    return ids, elapsed
+
+
+class Command(BaseCommand):
+    help = '订单号生成器基准测试：多进程多线程并发生成并检查重复'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='模拟的工作进程数')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='每个进程内的线程数')
+        parser.add_argument('--count', type=int, default=500000,
+                            help='每个进程生成的订单号数量')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        threads = options['threads']
+        count = options['count']
+
+        # fork 出的子进程会按各自进程号重新初始化生成器
+        ctx = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        with ctx.Pool(workers) as pool:
+            results = pool.map(_worker, [(count, threads)] * workers)
+        wall = time.perf_counter() - started
+
+        seen = set()
+        total = 0
+        rate = 0
+        for ids, elapsed in results:
+            if ids != sorted(ids) and threads == 1:
+                raise CommandError('同一进程内订单号未单调递增')
+            total += len(ids)
+            rate += len(ids) / elapsed
+            seen.update(ids)
+            self.stdout.write(
+                f'worker: {len(ids)} ids, {len(ids) / elapsed:,.0f} ids/s'
+            )
+
+        duplicates = total - len(seen)
+        max_length = max(len(i) for i in seen)
+        self.stdout.write(
+            f'total: {total} ids, {duplicates} duplicates, '
+            f'max length {max_length}, aggregate {rate:,.0f} ids/s, '
+            f'wall {wall:.2f}s'
+        )
+        if duplicates:
+            raise CommandError(f'发现 {duplicates} 个重复订单号')
+        self.stdout.write(self.style.SUCCESS('OK'))
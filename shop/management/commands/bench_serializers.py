@@ -0,0 +1,130 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.forms import model_to_dict
+from django.http import JsonResponse
+
+from shop import serializers
+from shop.models import Goods, Order, Tag, WechatUser
+from shop.serializers import GOODS_PROJECTOR, ORDER_PROJECTOR, json_response
+
+
+class Rollback(Exception):
+    """基准测试结束后回滚种子数据"""
+
+
+def legacy_goods(queryset):
+    """原实现：模型实例 + model_to_dict + 标准库 JsonResponse"""
+    ret = []
+    for good in queryset:
+        tag_list = []
+        tags = good.tags.split(',') if good.tags else []
+        for tag in tags:
+            tag_list.append({
+                "text": tag,
+                "theme": "primary",
+            })
+        data = model_to_dict(good, exclude=['url', 'stock'])
+        data['tags'] = tag_list
+        if good.url:
+            data['url'] = f"{settings.SITE_DOMAIN}{good.url.url}"
+        else:
+            data['url'] = None
+        ret.append(data)
+    return JsonResponse({'code': 200, 'data': ret})
+
+
+def legacy_orders(queryset):
+    """原实现：模型实例 + 手写字典 + 标准库 JsonResponse"""
+    orders_data = []
+    for order in queryset.select_related('goods'):
+        orders_data.append({
+            'id': order.id,
+            'order_number': order.order_number,
+            'goods_name': order.goods.name,
+            'quantity': order.quantity,
+            'total_amount': float(order.total_amount),
+            'status': order.status,
+            'status_display': order.get_status_display(),
+            'created_at': order.created_at.isoformat(),
+            'paid_at': order.paid_at.isoformat() if order.paid_at else None
+        })
+    return JsonResponse({'code': 200, 'data': orders_data})
+
+
+def projected_goods(queryset):
+    return json_response({'code': 200, 'data': GOODS_PROJECTOR.rows(queryset)})
+
+
+def projected_orders(queryset):
+    return json_response({'code': 200, 'data': ORDER_PROJECTOR.rows(queryset)})
+
+
+class Command(BaseCommand):
+    help = '接口序列化基准测试：对比模型实例 + JsonResponse 与字段投影器 + 快速 JSON 后端'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='每种载荷的行数')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='重复次数（取最好成绩）')
+
+    def handle(self, *args, **options):
+        backend = 'orjson' if serializers.orjson is not None else 'json'
+        self.stdout.write(f'JSON 后端: {backend}')
+        try:
+            with transaction.atomic():
+                goods, orders = self.seed(options['rows'])
+                cases = [
+                    ('goods', goods, legacy_goods, projected_goods),
+                    ('orders', orders, legacy_orders, projected_orders),
+                ]
+                for name, queryset, legacy, projected in cases:
+                    before = self.measure(legacy, queryset, options['repeat'])
+                    after = self.measure(projected, queryset, options['repeat'])
+                    self.stdout.write(
+                        f'{name}: legacy {before * 1000:.1f}ms, '
+                        f'projector {after * 1000:.1f}ms, '
+                        f'{before / after:.1f}x'
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS('OK'))
+
+    def seed(self, rows):
+        tag = Tag.objects.create(name='__bench__', is_active=False)
+        Goods.objects.bulk_create([
+            Goods(
+                name=f'商品{i}', price=Decimal('19.90'), tag=tag,
+                desc='基准测试商品描述', tags='新品,热卖,包邮', is_active=True
+            )
+            for i in range(rows)
+        ])
+        goods = Goods.objects.filter(tag=tag).first()
+        user = WechatUser.objects.create(openid='__bench__')
+        Order.objects.bulk_create([
+            Order(
+                order_number=f'BENCH{i:012d}', user=user, goods=goods,
+                quantity=1, total_amount=Decimal('19.90'),
+                receiver_name='张三', receiver_phone='13800000000',
+                receiver_address='地址', status='paid' if i % 2 else 'pending'
+            )
+            for i in range(rows)
+        ])
+        return (
+            Goods.objects.filter(tag=tag).order_by('id'),
+            Order.objects.filter(user=user).order_by('-created_at', '-id'),
+        )
+
+    def measure(self, serialize, queryset, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serialize(queryset.all())
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
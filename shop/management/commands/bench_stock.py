@@ -0,0 +1,78 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from shop import stock
+from shop.models import Goods, StockShard, Tag
+
+
+class Command(BaseCommand):
+    help = '库存并发扣减基准测试：对比单行库存与分片库存，并校验不超卖'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16,
+                            help='并发线程数')
+        parser.add_argument('--stock', type=int, default=2000,
+                            help='初始库存')
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 8],
+                            help='分片数（1 为单行基线）')
+
+    def handle(self, *args, **options):
+        tag = Tag.objects.create(name='__bench__', is_active=False)
+        try:
+            for shards in options['shards']:
+                self.run(tag, shards, options['threads'], options['stock'])
+        finally:
+            tag.delete()
+
+    def run(self, tag, shards, threads, initial):
+        stock.STOCK_SHARDS = shards
+        goods = Goods.objects.create(
+            name='__bench__', tag=tag, price=1, desc='', is_active=False
+        )
+        stock.set_stock(goods.id, initial)
+
+        counts = [0] * threads
+        retries = [0] * threads
+
+        def buyer(index):
+            try:
+                while True:
+                    try:
+                        with transaction.atomic():
+                            stock.take_stock(goods.id, 1)
+                    except stock.InsufficientStock:
+                        return
+                    except OperationalError:
+                        # SQLite 等库级锁数据库下的锁冲突，重试
+                        retries[index] += 1
+                        continue
+                    counts[index] += 1
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=buyer, args=(i,)) for i in range(threads)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        sold = sum(counts)
+        remaining = stock.available_stock(goods.id)
+        negative = StockShard.objects.filter(
+            goods_id=goods.id, available__lt=0
+        ).count()
+        self.stdout.write(
+            f'shards={shards}: sold {sold}/{initial}, remaining {remaining}, '
+            f'{sold / elapsed:,.0f} reservations/s, '
+            f'{sum(retries)} lock retries'
+        )
+        goods.delete()
+        if sold != initial or remaining != 0 or negative:
+            raise CommandError('库存扣减结果不一致（超卖或少卖）')
@@ -0,0 +1,64 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F
+
+from shop.images import generate_derivatives, store_derivatives
+from shop.models import Goods
+
+
+def _generate(item):
+    goods_id, source_name = item
+    try:
+        return goods_id, source_name, generate_derivatives(source_name), None
+    except Exception as e:
+        return goods_id, source_name, None, f'{type(e).__name__}: {e}'
+
+
+class Command(BaseCommand):
+    help = '为已有商品批量生成图片衍生图（多进程）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='进程数（默认 CPU 核数）')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='每批处理的商品数量')
+        parser.add_argument('--force', action='store_true',
+                            help='重新生成全部商品（修改尺寸或质量配置后使用）')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Goods.objects.exclude(url='').exclude(url__isnull=True)
+        if not options['force']:
+            queryset = queryset.exclude(images_source=F('url'))
+        queryset = queryset.order_by('id').values_list('id', 'url')
+
+        ctx = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        done = failed = 0
+        last_id = 0
+        with ProcessPoolExecutor(options['workers'], mp_context=ctx) as pool:
+            while True:
+                batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                # 子进程只读写文件存储，fork 前关闭数据库连接避免被共享
+                connections.close_all()
+                for goods_id, source_name, images, error in pool.map(
+                    _generate, batch
+                ):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'goods {goods_id}: {error}')
+                        continue
+                    store_derivatives(goods_id, source_name, images)
+                    done += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'generated {done} goods, {failed} failed, {elapsed:.1f}s'
+        )
@@ -0,0 +1,54 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shop.orders import (
+    ORDER_EXPIRY_BATCH_SIZE, ORDER_EXPIRY_PAUSE, ORDER_PENDING_TTL,
+    expire_pending_orders
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '取消超时未支付的订单并释放预占库存（分块批量更新，带限速）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=ORDER_PENDING_TTL,
+                            help='待支付超过该时长（秒）的订单被取消')
+        parser.add_argument('--batch-size', type=int,
+                            default=ORDER_EXPIRY_BATCH_SIZE,
+                            help='每个事务处理的订单数')
+        parser.add_argument('--pause', type=float, default=ORDER_EXPIRY_PAUSE,
+                            help='批次之间的暂停（秒）')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='循环执行间隔（秒），为0时只执行一次')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if not interval:
+            self.run_once(options)
+            return
+        while True:
+            # 循环执行时丢弃失效的连接，出错只记录日志，下个周期重试
+            close_old_connections()
+            try:
+                self.run_once(options)
+            except Exception:
+                logger.exception('取消超时订单出错')
+            time.sleep(interval)
+
+    def run_once(self, options):
+        started = time.perf_counter()
+        cancelled = expire_pending_orders(
+            ttl=options['ttl'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+        )
+        self.stdout.write(
+            f'cancelled {cancelled} expired orders '
+            f'in {time.perf_counter() - started:.1f}s'
+        )
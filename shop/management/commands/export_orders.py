@@ -0,0 +1,59 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from shop.export import EXPORT_FORMATS, filter_orders, iter_order_rows
+from shop.models import Order
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise CommandError(f'无法解析时间: {value}')
+        parsed = timezone.datetime(date.year, date.month, date.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = '流式导出订单（CSV/JSONL），内存占用与导出行数无关'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS),
+                            default='csv', help='导出格式')
+        parser.add_argument(
+            '--status',
+            choices=[status for status, _ in Order.ORDER_STATUS_CHOICES],
+            help='订单状态'
+        )
+        parser.add_argument('--start', help='创建时间起（含），如 2024-01-01')
+        parser.add_argument('--end', help='创建时间止（不含），如 2024-02-01')
+        parser.add_argument('--output', help='输出文件，默认标准输出')
+
+    def handle(self, *args, **options):
+        encode, _ = EXPORT_FORMATS[options['format']]
+        queryset = filter_orders(
+            status=options['status'],
+            start=_parse_time(options['start']),
+            end=_parse_time(options['end'])
+        )
+        rows = iter_order_rows(queryset)
+
+        if options['output']:
+            output = open(options['output'], 'w', encoding='utf-8',
+                          newline='')
+        else:
+            output = sys.stdout
+        try:
+            for line in encode(rows):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,101 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from shop.bestsellers import (
+    BEST_SELLER_WINDOWS, bucket_hour, expire_windows
+)
+from shop.models import Order, SalesBucket
+from shop.rollups import load_orders, order_transitions
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        '维护热销榜：从各时间窗口扣除滑出窗口的小时销量（建议每几分钟执行）；'
+        '--rebuild 按小时销量重新汇总各窗口，--backfill 先按订单数据重建小时销量'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='按小时销量重新汇总各窗口')
+        parser.add_argument('--backfill', action='store_true',
+                            help='按订单数据重建小时销量（应在低峰期执行）')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='回填时每段读取的订单数')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='循环执行间隔（秒），为0时只执行一次')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.backfill(options['chunk_size'])
+        rebuild = options['rebuild'] or options['backfill']
+        interval = options['interval']
+        if not interval:
+            self.run_once(rebuild)
+            return
+        while True:
+            # 循环执行时丢弃失效的连接，出错只记录日志，下个周期重试
+            close_old_connections()
+            try:
+                self.run_once(rebuild)
+            except Exception:
+                logger.exception('维护热销榜出错')
+            else:
+                rebuild = False
+            time.sleep(interval)
+
+    def run_once(self, rebuild):
+        started = time.perf_counter()
+        expire_windows(rebuild=rebuild)
+        self.stdout.write(
+            f'{"rebuilt" if rebuild else "expired"} best-seller windows '
+            f'in {time.perf_counter() - started:.2f}s'
+        )
+
+    def backfill(self, chunk_size):
+        """
+        按主键分段读取订单，重建最长窗口内、当前小时之前已支付且未取消订单的
+        小时销量；当前小时及之后的小时桶保留支付回调实时累加的结果，不被覆盖
+        """
+        current = bucket_hour(timezone.now())
+        since = current - timedelta(hours=max(BEST_SELLER_WINDOWS.values()))
+        buckets = {}
+        queryset = Order.objects.order_by('id')
+        last_id = 0
+        while True:
+            chunk = load_orders(queryset.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            for order, lines in chunk:
+                if order['status'] == 'cancelled':
+                    continue
+                for status, when in order_transitions(order):
+                    if status != 'paid' or not since <= when < current:
+                        continue
+                    hour = bucket_hour(when)
+                    for goods_id, tag_id, quantity, _ in lines:
+                        entry = buckets.setdefault(
+                            (hour, goods_id), [tag_id, 0]
+                        )
+                        entry[1] += quantity
+            last_id = chunk[-1][0]['id']
+            if len(chunk) < chunk_size:
+                break
+
+        with transaction.atomic():
+            SalesBucket.objects.filter(hour__lt=current).delete()
+            SalesBucket.objects.bulk_create([
+                SalesBucket(
+                    hour=hour, goods_id=goods_id, tag_id=tag_id,
+                    quantity=quantity
+                )
+                for (hour, goods_id), (tag_id, quantity) in buckets.items()
+            ], batch_size=chunk_size)
+        self.stdout.write(f'backfilled {len(buckets)} hourly sales buckets')
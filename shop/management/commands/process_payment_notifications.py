@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from shop.notifications import process_batch, queue_depth
+
+
+logger = logging.getLogger(__name__)
+
+# 处理出错后的最长等待（秒）
+MAX_ERROR_BACKOFF = 60
+
+
+class Command(BaseCommand):
+    help = '处理支付回调队列'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='并行处理线程数')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='每批拉取的回调条数')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--once', action='store_true',
+                            help='处理完当前到期的回调后退出')
+        parser.add_argument('--stats', action='store_true',
+                            help='只输出队列深度')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for status, count in queue_depth().items():
+                self.stdout.write(f'{status}: {count}')
+            return
+
+        self.failed = False
+        workers = [
+            threading.Thread(
+                target=self.work,
+                args=(options['batch_size'], options['interval'],
+                      options['once']),
+                daemon=True
+            )
+            for _ in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            pass
+        if self.failed:
+            raise CommandError('处理支付回调出错，详见日志')
+
+    def work(self, batch_size, interval, once):
+        """
+        循环处理回调；出错时记录日志并退避后重试，不让线程退出
+        （如死锁回滚、MySQL wait_timeout 断开的连接）
+        """
+        errors = 0
+        try:
+            while True:
+                # 丢弃已失效或超过 CONN_MAX_AGE 的连接
+                close_old_connections()
+                try:
+                    processed = process_batch(batch_size)
+                except Exception:
+                    if once:
+                        logger.exception('处理支付回调出错')
+                        self.failed = True
+                        return
+                    errors += 1
+                    delay = min(
+                        max(interval, 1) * 2 ** (errors - 1), MAX_ERROR_BACKOFF
+                    )
+                    logger.exception('处理支付回调出错，%.1f 秒后重试', delay)
+                    time.sleep(delay)
+                    continue
+                errors = 0
+                if processed:
+                    self.stdout.write(f'processed {processed} notifications')
+                    continue
+                if once:
+                    return
+                time.sleep(interval)
+        finally:
+            connection.close()
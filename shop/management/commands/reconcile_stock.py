@@ -0,0 +1,51 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shop.models import StockShard
+from shop.stock import reconcile_stock, release_expired_reservations
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '库存对账：清理已取消/已支付订单的过期预占并将剩余库存重新均分到各分片'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='循环执行间隔（秒），为0时只执行一次')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if not interval:
+            self.run_once()
+            return
+        while True:
+            # 循环执行时丢弃失效的连接，出错只记录日志，下个周期重试
+            close_old_connections()
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('库存对账出错')
+            time.sleep(interval)
+
+    def run_once(self):
+        expired = 0
+        while True:
+            processed = release_expired_reservations(batch_size=500)
+            expired += processed
+            if processed < 500:
+                break
+        goods_ids = StockShard.objects.values_list(
+            'goods_id', flat=True
+        ).distinct()
+        count = 0
+        for goods_id in goods_ids:
+            reconcile_stock(goods_id)
+            count += 1
+        self.stdout.write(
+            f'processed {expired} expired orders, reconciled {count} goods'
+        )
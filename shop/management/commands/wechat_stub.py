@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from shop.wechat_stub import WechatStubServer
+
+
+class Command(BaseCommand):
+    help = '启动微信接口桩服务（可注入延迟与错误），用于本地联调与压测'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8900)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='每个请求的延迟（秒）')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='随机返回错误的比例（0-1）')
+        parser.add_argument('--error-status', type=int, default=503,
+                            help='注入错误时的 HTTP 状态码')
+
+    def handle(self, *args, **options):
+        server = WechatStubServer(
+            options['host'], options['port'],
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+        )
+        self.stdout.write(
+            f'wechat stub listening on {server.url} '
+            f'(WECHAT_API_BASE / WECHAT_PAY_API_BASE)'
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
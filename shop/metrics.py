@@ -0,0 +1,150 @@
+"""
+Prometheus 指标
+
+MetricsMiddleware 为每个视图记录请求数、延迟分布和每请求 SQL 数/耗时；
+微信接口每次请求（含重试）记录结果与延迟；订单创建、支付、取消计数。
+指标通过 /api/metrics/ 以 Prometheus 文本格式输出。
+
+gunicorn 多进程部署时设置 METRICS_MULTIPROC_DIR（或 PROMETHEUS_MULTIPROC_DIR
+环境变量）为所有 worker 共享的目录，各进程把指标写入其中的 mmap 文件，
+抓取时汇总全部进程；该目录需在每次启动前清空，并在 gunicorn 配置中登记
+worker 退出:
+
+    def child_exit(server, worker):
+        from shop.metrics import mark_process_dead
+        mark_process_dead(worker.pid)
+"""
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+# 多进程共享的指标目录，未配置时仅统计当前进程
+METRICS_MULTIPROC_DIR = getattr(
+    settings, 'METRICS_MULTIPROC_DIR',
+    os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+)
+if METRICS_MULTIPROC_DIR:
+    # prometheus_client 在导入时根据该环境变量选择多进程存储
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = METRICS_MULTIPROC_DIR
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess
+)
+
+
+# 监控接口（指标、熔断状态）的访问令牌（Authorization: Bearer <token>），为空时不校验
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+# 延迟分布的分桶（秒）
+METRICS_LATENCY_BUCKETS = getattr(settings, 'METRICS_LATENCY_BUCKETS', (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+))
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+HTTP_REQUESTS = Counter(
+    'shop_http_requests_total', '视图请求数',
+    ['view', 'method', 'status']
+)
+HTTP_DURATION = Histogram(
+    'shop_http_request_duration_seconds', '视图处理耗时',
+    ['view', 'method'], buckets=METRICS_LATENCY_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'shop_http_request_db_queries', '每个请求执行的 SQL 数',
+    ['view'], buckets=QUERY_COUNT_BUCKETS
+)
+DB_DURATION = Histogram(
+    'shop_http_request_db_duration_seconds', '每个请求的数据库耗时',
+    ['view'], buckets=METRICS_LATENCY_BUCKETS
+)
+OUTBOUND_REQUESTS = Counter(
+    'shop_outbound_requests_total', '外部接口请求数（每次重试单独计数）',
+    ['service', 'endpoint', 'outcome']
+)
+OUTBOUND_DURATION = Histogram(
+    'shop_outbound_request_duration_seconds', '外部接口单次请求耗时',
+    ['service', 'endpoint'], buckets=METRICS_LATENCY_BUCKETS
+)
+ORDERS_CREATED = Counter('shop_orders_created_total', '创建的订单数')
+ORDER_TRANSITIONS = Counter(
+    'shop_order_transitions_total', '订单状态迁移次数', ['status']
+)
+
+
+def view_label(request):
+    """以路由名称作为视图标签，避免把路径参数带入标签造成基数膨胀"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.url_name or match.view_name or '<unnamed>'
+
+
+def observe_outbound(service, endpoint, outcome, duration=None):
+    """记录一次外部接口请求；未实际发出的请求（如熔断）不记录耗时"""
+    OUTBOUND_REQUESTS.labels(service, endpoint, outcome).inc()
+    if duration is not None:
+        OUTBOUND_DURATION.labels(service, endpoint).observe(duration)
+
+
+def count_order_transition(status, count=1):
+    if count:
+        ORDER_TRANSITIONS.labels(status).inc(count)
+
+
+def render():
+    """返回 (Prometheus 文本格式的指标, Content-Type)"""
+    if METRICS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """worker 退出后清理其存活期指标文件（gunicorn child_exit 钩子中调用）"""
+    if METRICS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """
+    记录每个视图的请求数、耗时和 SQL 统计
+    需放在 QueryAccountingMiddleware 之前，以读取其统计结果；
+    同时支持同步和异步调用链
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, elapsed):
+        view = view_label(request)
+        HTTP_REQUESTS.labels(view, request.method, response.status_code).inc()
+        HTTP_DURATION.labels(view, request.method).observe(elapsed)
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            DB_QUERIES.labels(view).observe(stats.count)
+            DB_DURATION.labels(view).observe(stats.duration)
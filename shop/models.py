@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.db import models
-import time
-import random
+from django.utils import timezone
+from shop.order_number import next_order_number
 
 
 class WechatUser(models.Model):
@@ -37,10 +38,25 @@ class Tag(models.Model):
     name = models.CharField(max_length=32, verbose_name='标签名称')
     is_active = models.BooleanField(default=True, verbose_name='是否激活')
     sequence = models.IntegerField(default=0, verbose_name='排序')
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='更新时间'
+    )
 
     class Meta:
         verbose_name = '商品标签'
         verbose_name_plural = verbose_name
+        indexes = [
+            # 标签列表：WHERE is_active ORDER BY sequence
+            # 按 sequence 有序扫描并直接在索引上过滤 is_active，无需排序
+            models.Index(
+                fields=['sequence', 'is_active'], name='tag_seq_active_idx'
+            ),
+            # 标签列表的 ETag 校验值：COUNT(is_active) / MAX(updated_at)
+            # 覆盖索引，聚合时只扫描索引
+            models.Index(
+                fields=['is_active', 'updated_at'], name='tag_active_updated_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -57,10 +73,32 @@ class Goods(models.Model):
         Tag, on_delete=models.CASCADE, verbose_name='商品标签'
     )
     url = models.FileField()
-    desc = models.CharField()
+    # 不限长度的 CharField 只有 PostgreSQL 支持，MySQL/SQLite 下使用 TextField
+    desc = models.TextField()
     tags = models.CharField(
         max_length=200, blank=True, verbose_name='商品标签（逗号分隔）'
     )
+    # 实际可用库存分散在 StockShard 中，此处为扣除预占后的可售数量（设置或对账时回写）
+    stock = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name='库存（留空不限）',
+        help_text='修改时填写库存总量，保存后显示扣除未支付订单预占后的可售数量'
+    )
+    # 保存时根据 tags/url 生成，接口直接读取
+    tag_list = models.JSONField(
+        default=list, blank=True, editable=False, verbose_name='标签数据'
+    )
+    image_url = models.CharField(
+        max_length=500, null=True, blank=True, editable=False,
+        verbose_name='图片地址'
+    )
+    # 后台生成的各尺寸衍生图地址，images_source 为生成时对应的原图
+    images = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name='衍生图'
+    )
+    images_source = models.CharField(
+        max_length=255, null=True, blank=True, editable=False,
+        verbose_name='衍生图原图'
+    )
     created_at = models.DateTimeField(
         auto_now_add=True, verbose_name='创建时间'
     )
@@ -71,10 +109,42 @@ class Goods(models.Model):
     class Meta:
         verbose_name = '商品'
         verbose_name_plural = verbose_name
+        indexes = [
+            # 商品列表：WHERE tag_id = ? AND is_active = ? ORDER BY id
+            models.Index(
+                fields=['tag', 'is_active', 'id'], name='goods_tag_active_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def refresh_derived_fields(self):
+        """根据逗号分隔的标签和图片文件生成接口所需的结构化数据"""
+        themes = getattr(settings, 'GOODS_TAG_THEMES', {})
+        self.tag_list = [
+            {'text': tag, 'theme': themes.get(tag, 'primary')}
+            for tag in (t.strip() for t in (self.tags or '').split(','))
+            if tag
+        ]
+        if self.url:
+            self.image_url = f"{settings.SITE_DOMAIN}{self.url.url}"
+        else:
+            self.image_url = None
+        # 原图已更换：旧衍生图作废，生成新图之前接口回退到原图地址
+        if self.images_source != (self.url.name if self.url else None):
+            self.images = {}
+
+    def save(self, *args, **kwargs):
+        self.refresh_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields, 'tag_list', 'image_url', 'images',
+                'updated_at'
+            }
+        super().save(*args, **kwargs)
+
 
 class Order(models.Model):
     """订单模型"""
@@ -97,6 +167,7 @@ class Order(models.Model):
     user = models.ForeignKey(
         WechatUser, on_delete=models.CASCADE, verbose_name='用户'
     )
+    # 多商品订单中为首个商品，完整明细见 OrderItem
     goods = models.ForeignKey(
         Goods, on_delete=models.CASCADE, verbose_name='商品'
     )
@@ -128,9 +199,17 @@ class Order(models.Model):
     prepay_id = models.CharField(
         max_length=64, blank=True, null=True, verbose_name='预支付ID'
     )
+    # 有效期内再次发起支付时复用 prepay_id
+    prepay_expires_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='预支付ID过期时间'
+    )
     transaction_id = models.CharField(
         max_length=64, blank=True, null=True, verbose_name='微信交易号'
     )
+    # 订单超时取消后才收到支付成功回调，需人工退款或恢复订单
+    refund_required = models.BooleanField(
+        default=False, verbose_name='待退款'
+    )
 
     # 时间信息
     created_at = models.DateTimeField(
@@ -142,18 +221,355 @@ class Order(models.Model):
     completed_at = models.DateTimeField(
         null=True, blank=True, verbose_name='完成时间'
     )
+    cancelled_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='取消时间'
+    )
 
     class Meta:
         verbose_name = '订单'
         verbose_name_plural = verbose_name
         ordering = ['-created_at']
+        indexes = [
+            # 订单列表游标分页：WHERE user_id = ? AND (created_at, id) < (?, ?)
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                name='order_user_created_idx'
+            ),
+            # 支付回调去重：WHERE transaction_id = ?
+            models.Index(
+                fields=['transaction_id'],
+                name='order_transaction_id_idx'
+            ),
+            # 后台列表默认排序与按月筛选
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='order_created_idx'
+            ),
+            # 超时订单清理：WHERE status = 'pending' AND created_at < ?
+            # ORDER BY created_at, id
+            models.Index(
+                fields=['status', 'created_at', 'id'],
+                name='order_status_created_idx'
+            ),
+            # 后台按手机号前缀搜索
+            models.Index(
+                fields=['receiver_phone'],
+                name='order_receiver_phone_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.order_number} - {self.goods.name}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            self.order_number = f"ORD{int(time.time())}{random.randint(1000, 9999)}"
+            self.order_number = next_order_number()
         if not self.total_amount:
             self.total_amount = self.goods.price * self.quantity
         super().save(*args, **kwargs)
+
+
+class OrderItem(models.Model):
+    """订单明细模型"""
+    id = models.AutoField(primary_key=True)
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name='items',
+        verbose_name='订单'
+    )
+    goods = models.ForeignKey(
+        Goods, on_delete=models.CASCADE, verbose_name='商品'
+    )
+    quantity = models.PositiveIntegerField(default=1, verbose_name='数量')
+    price = models.DecimalField(
+        max_digits=10, decimal_places=2, verbose_name='单价'
+    )
+    total_amount = models.DecimalField(
+        max_digits=10, decimal_places=2, verbose_name='小计'
+    )
+
+    class Meta:
+        verbose_name = '订单明细'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.order_id} - {self.goods_id} x {self.quantity}"
+
+
+class StockShard(models.Model):
+    """库存分片模型，抢购时各分片独立扣减，避免单行锁竞争"""
+    id = models.AutoField(primary_key=True)
+    goods = models.ForeignKey(
+        Goods, on_delete=models.CASCADE, related_name='stock_shards',
+        verbose_name='商品'
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name='分片号')
+    available = models.IntegerField(default=0, verbose_name='可用库存')
+
+    class Meta:
+        verbose_name = '库存分片'
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=['goods', 'shard'], name='stock_shard_goods_shard_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.goods_id}#{self.shard}: {self.available}"
+
+
+class StockReservation(models.Model):
+    """库存预占记录"""
+    STATUS_CHOICES = (
+        ('reserved', '已预占'),
+        ('committed', '已确认'),
+        ('released', '已释放'),
+    )
+
+    id = models.AutoField(primary_key=True)
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name='stock_reservations',
+        verbose_name='订单'
+    )
+    goods = models.ForeignKey(
+        Goods, on_delete=models.CASCADE, verbose_name='商品'
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name='分片号')
+    quantity = models.PositiveIntegerField(verbose_name='数量')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='reserved',
+        verbose_name='状态'
+    )
+    expires_at = models.DateTimeField(verbose_name='过期时间')
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='创建时间'
+    )
+
+    class Meta:
+        verbose_name = '库存预占'
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 过期预占扫描：WHERE status = 'reserved' AND expires_at < ?
+            models.Index(
+                fields=['status', 'expires_at'],
+                name='stock_resv_status_expires_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} - {self.goods_id} x {self.quantity}"
+
+
+class PaymentNotification(models.Model):
+    """微信支付回调队列，回调先落库应答，再由后台 worker 异步处理"""
+    STATUS_CHOICES = (
+        ('pending', '待处理'),
+        ('done', '已处理'),
+        ('failed', '处理失败'),
+    )
+
+    id = models.AutoField(primary_key=True)
+    out_trade_no = models.CharField(max_length=32, verbose_name='订单号')
+    transaction_id = models.CharField(
+        max_length=64, unique=True, verbose_name='微信交易号'
+    )
+    payload = models.TextField(verbose_name='回调原文')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='处理状态'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='处理次数')
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name='下次处理时间'
+    )
+    last_error = models.TextField(blank=True, verbose_name='最近错误')
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='创建时间'
+    )
+    processed_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='处理时间'
+    )
+
+    class Meta:
+        verbose_name = '支付回调'
+        verbose_name_plural = verbose_name
+        indexes = [
+            # worker 拉取：WHERE status = 'pending' AND next_attempt_at <= ?
+            models.Index(
+                fields=['status', 'next_attempt_at'],
+                name='pay_notify_status_next_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.out_trade_no} ({self.transaction_id})"
+
+
+class SalesRollup(models.Model):
+    """销售日汇总基类：订单在该日进入某状态（支付/完成/取消）的订单数、件数与金额"""
+    STATUS_CHOICES = (
+        ('paid', '已支付'),
+        ('completed', '已完成'),
+        ('cancelled', '已取消'),
+    )
+
+    id = models.AutoField(primary_key=True)
+    day = models.DateField(verbose_name='日期')
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, verbose_name='订单状态'
+    )
+    orders = models.PositiveIntegerField(default=0, verbose_name='订单数')
+    quantity = models.PositiveIntegerField(default=0, verbose_name='件数')
+    amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='金额'
+    )
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    """按日、订单状态汇总"""
+
+    class Meta:
+        verbose_name = '销售报表'
+        verbose_name_plural = verbose_name
+        constraints = [
+            # 增量更新定位行，同时支持按日期范围读取
+            models.UniqueConstraint(
+                fields=['day', 'status'], name='daily_sales_day_status_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status}"
+
+
+class DailyGoodsSales(SalesRollup):
+    """按日、商品、订单状态汇总"""
+    # 商品/标签删除后保留历史汇总
+    goods = models.ForeignKey(
+        Goods, on_delete=models.DO_NOTHING, db_constraint=False,
+        verbose_name='商品'
+    )
+
+    class Meta:
+        verbose_name = '商品销售日汇总'
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'status', 'goods'],
+                name='daily_goods_sales_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.goods_id} {self.status}"
+
+
+class DailyTagSales(SalesRollup):
+    """按日、商品标签、订单状态汇总"""
+    # 商品/标签删除后保留历史汇总
+    tag = models.ForeignKey(
+        Tag, on_delete=models.DO_NOTHING, db_constraint=False,
+        verbose_name='商品标签'
+    )
+
+    class Meta:
+        verbose_name = '标签销售日汇总'
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'status', 'tag'],
+                name='daily_tag_sales_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.tag_id} {self.status}"
+
+
+class SalesBucket(models.Model):
+    """商品每小时销量，热销榜各时间窗口按小时滑动"""
+    id = models.AutoField(primary_key=True)
+    hour = models.DateTimeField(verbose_name='小时')
+    goods = models.ForeignKey(
+        Goods, on_delete=models.DO_NOTHING, db_constraint=False,
+        verbose_name='商品'
+    )
+    tag = models.ForeignKey(
+        Tag, on_delete=models.DO_NOTHING, db_constraint=False,
+        verbose_name='商品标签'
+    )
+    quantity = models.PositiveIntegerField(default=0, verbose_name='销量')
+
+    class Meta:
+        verbose_name = '商品小时销量'
+        verbose_name_plural = verbose_name
+        constraints = [
+            # 支付时定位行累加；过期扣除时按小时范围读取
+            models.UniqueConstraint(
+                fields=['hour', 'goods'], name='sales_bucket_hour_goods_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.hour} {self.goods_id}: {self.quantity}"
+
+
+class BestSeller(models.Model):
+    """热销榜：商品在各时间窗口内的销量，支付时累加，滑出窗口的小时销量定时扣除"""
+    id = models.AutoField(primary_key=True)
+    period = models.CharField(max_length=8, verbose_name='时间窗口')
+    goods = models.ForeignKey(
+        Goods, on_delete=models.CASCADE, verbose_name='商品'
+    )
+    tag = models.ForeignKey(
+        Tag, on_delete=models.DO_NOTHING, db_constraint=False,
+        verbose_name='商品标签'
+    )
+    quantity = models.IntegerField(default=0, verbose_name='销量')
+
+    class Meta:
+        verbose_name = '热销榜'
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'goods'], name='best_seller_period_goods_uniq'
+            ),
+        ]
+        indexes = [
+            # 榜单读取：WHERE period = ? ORDER BY quantity DESC, goods_id DESC
+            # LIMIT k，反向扫描索引，只读取 k 行
+            models.Index(
+                fields=['period', 'quantity', 'goods'],
+                name='best_seller_period_qty_idx'
+            ),
+            # 分类榜单：WHERE period = ? AND tag_id = ? ORDER BY ...
+            models.Index(
+                fields=['period', 'tag', 'quantity', 'goods'],
+                name='best_seller_period_tag_qty_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.goods_id}: {self.quantity}"
+
+
+class BestSellerWindow(models.Model):
+    """热销榜各时间窗口已扣除到的小时（不含）"""
+    period = models.CharField(
+        max_length=8, primary_key=True, verbose_name='时间窗口'
+    )
+    expired_before = models.DateTimeField(verbose_name='已扣除至')
+
+    class Meta:
+        verbose_name = '热销榜窗口'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.period}: {self.expired_before}"
@@ -0,0 +1,134 @@
+"""
+支付回调队列
+
+回调接口只做验签并把回调原文写入 PaymentNotification 后立即应答 SUCCESS，
+订单状态迁移及后续履约逻辑由 process_payment_notifications 命令批量处理，
+失败按指数退避重试，超过最大次数后标记为失败等待人工处理。
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from shop.models import Order, PaymentNotification
+from shop.orders import mark_order_paid
+from shop.signals import order_paid
+
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_NOTIFY_MAX_ATTEMPTS = getattr(
+    settings, 'PAYMENT_NOTIFY_MAX_ATTEMPTS', 8
+)
+PAYMENT_NOTIFY_BACKOFF = getattr(settings, 'PAYMENT_NOTIFY_BACKOFF', 5)
+PAYMENT_NOTIFY_MAX_BACKOFF = getattr(
+    settings, 'PAYMENT_NOTIFY_MAX_BACKOFF', 10 * 60
+)
+# 拉取后的占用时长（秒）：期间其他 worker 不会拉取，worker 中途退出时到期后重新处理
+PAYMENT_NOTIFY_LEASE = getattr(settings, 'PAYMENT_NOTIFY_LEASE', 5 * 60)
+
+
+def enqueue_notification(out_trade_no, transaction_id, payload):
+    """写入回调队列，同一交易号的重复回调会被忽略"""
+    PaymentNotification.objects.bulk_create([
+        PaymentNotification(
+            out_trade_no=out_trade_no,
+            transaction_id=transaction_id,
+            payload=payload
+        )
+    ], ignore_conflicts=True)
+
+
+def backoff_delay(attempts):
+    """第 attempts 次失败后的重试间隔（秒），带随机抖动"""
+    delay = min(
+        PAYMENT_NOTIFY_BACKOFF * 2 ** (attempts - 1),
+        PAYMENT_NOTIFY_MAX_BACKOFF
+    )
+    return random.uniform(delay / 2, delay)
+
+
+def handle_notification(notification):
+    """处理单条回调"""
+    result = mark_order_paid(
+        notification.out_trade_no, notification.transaction_id
+    )
+    if result == 'missing':
+        raise Order.DoesNotExist(f'订单 {notification.out_trade_no} 不存在')
+    if result == 'refund':
+        logger.warning(
+            '订单 %s 已取消后收到支付 %s，已标记待退款',
+            notification.out_trade_no, notification.transaction_id
+        )
+    if result == 'paid':
+        # 回调所在事务提交后再通知履约逻辑，回滚时不会误发
+        order_number = notification.out_trade_no
+        transaction_id = notification.transaction_id
+        transaction.on_commit(lambda: order_paid.send(
+            sender=Order,
+            order_number=order_number,
+            transaction_id=transaction_id
+        ))
+    return result
+
+
+def process_batch(batch_size=100):
+    """
+    拉取并处理一批到期回调，返回处理条数
+    拉取用 SELECT ... FOR UPDATE SKIP LOCKED 并顺延 next_attempt_at 占用这批回调，
+    随即提交，多个 worker 可并行拉取互不阻塞；
+    每条回调连同订单状态、汇总和热销榜的累加在各自的短事务中提交，
+    热点汇总行的锁只持有一条回调的时间
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            PaymentNotification.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            PaymentNotification.objects.filter(
+                id__in=[notification.id for notification in batch]
+            ).update(
+                next_attempt_at=now + timedelta(seconds=PAYMENT_NOTIFY_LEASE)
+            )
+
+    for notification in batch:
+        notification.attempts += 1
+        try:
+            with transaction.atomic():
+                handle_notification(notification)
+                notification.status = 'done'
+                notification.processed_at = timezone.now()
+                notification.save(update_fields=[
+                    'status', 'attempts', 'processed_at'
+                ])
+        except Exception as e:
+            notification.last_error = str(e)[:1000]
+            if notification.attempts >= PAYMENT_NOTIFY_MAX_ATTEMPTS:
+                notification.status = 'failed'
+            else:
+                notification.status = 'pending'
+                notification.next_attempt_at = timezone.now() + timedelta(
+                    seconds=backoff_delay(notification.attempts)
+                )
+            notification.save(update_fields=[
+                'status', 'attempts', 'next_attempt_at', 'last_error'
+            ])
+    return len(batch)
+
+
+def queue_depth():
+    """各状态的回调数量"""
+    depth = {status: 0 for status, _ in PaymentNotification.STATUS_CHOICES}
+    rows = PaymentNotification.objects.values('status').annotate(
+        count=Count('id')
+    )
+    for row in rows:
+        depth[row['status']] = row['count']
+    return depth
@@ -0,0 +1,76 @@
+"""
+订单号生成器（Snowflake 风格）
+
+格式: ORD + 13位毫秒时间戳 + 2位节点ID + 5位进程号 + 9位进程内序列号，共32位
+- 时间戳取自进程启动时锚定的单调时钟，进程内不会回拨
+- 序列号使用 itertools.count，在 GIL 下原子递增，无需加锁；
+  序列号随机起步，可能在任意时刻越过 10^9，溢出部分进位到时间戳
+  （时间戳 * 10^9 + 序列号整体递增），进程内生成的订单号保持唯一且单调递增，
+  时间戳最多比实际时间超前“序列号回绕次数”毫秒
+- 节点ID区分机器（配置 ORDER_NODE_ID），进程号区分同一机器上的 worker，
+  fork 出的子进程会自动重新初始化
+"""
+import itertools
+import os
+import random
+import socket
+import time
+import zlib
+
+from django.conf import settings
+
+
+PREFIX = 'ORD'
+NODE_ID_DIGITS = 2
+PROCESS_ID_DIGITS = 5
+SEQUENCE_DIGITS = 9
+SEQUENCE_MODULUS = 10 ** SEQUENCE_DIGITS
+
+_epoch_ms = 0
+_monotonic_ns = 0
+_sequence = None
+_worker_id = ''
+
+
+def default_node_id():
+    """
+    获取节点ID
+    优先使用环境变量/配置 ORDER_NODE_ID，否则根据主机名推导
+    """
+    node_id = os.environ.get(
+        'ORDER_NODE_ID', getattr(settings, 'ORDER_NODE_ID', None)
+    )
+    if node_id is None or node_id == '':
+        node_id = zlib.crc32(socket.gethostname().encode('utf-8'))
+    return int(node_id) % 10 ** NODE_ID_DIGITS
+
+
+def reset(node_id=None, process_id=None):
+    """重置生成器状态（进程启动、fork 后调用）"""
+    global _epoch_ms, _monotonic_ns, _sequence, _worker_id
+    if node_id is None:
+        node_id = default_node_id()
+    if process_id is None:
+        process_id = os.getpid()
+    _epoch_ms = time.time_ns() // 1_000_000
+    _monotonic_ns = time.monotonic_ns()
+    # 序列号随机起步，降低进程号复用后与上一个进程撞号的概率
+    _sequence = itertools.count(random.randrange(SEQUENCE_MODULUS))
+    _worker_id = (
+        f"{node_id % 10 ** NODE_ID_DIGITS:0{NODE_ID_DIGITS}d}"
+        f"{process_id % 10 ** PROCESS_ID_DIGITS:0{PROCESS_ID_DIGITS}d}"
+    )
+
+
+def next_order_number():
+    """生成一个新的订单号"""
+    seq = next(_sequence)
+    now_ms = _epoch_ms + (time.monotonic_ns() - _monotonic_ns) // 1_000_000
+    # 序列号超过 9 位时进位到时间戳，回绕后的订单号不会小于之前的
+    now_ms, seq = divmod(now_ms * SEQUENCE_MODULUS + seq, SEQUENCE_MODULUS)
+    # 13位毫秒时间戳可用到2286年，无需补零
+    return f"{PREFIX}{now_ms}{_worker_id}{seq:09d}"
+
+
+reset()
+os.register_at_fork(after_in_child=reset)
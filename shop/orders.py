@@ -0,0 +1,216 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from shop.metrics import ORDERS_CREATED
+from shop.models import Goods, Order, OrderItem
+from shop.rollups import record_transition
+from shop.stock import (
+    InsufficientStock, commit_order_stock, release_orders_stock, reserve_stock
+)
+
+
+MAX_CART_ITEMS = 50
+
+# 待支付订单超时取消：超时时长、每块订单数、块之间的暂停（秒）
+ORDER_PENDING_TTL = getattr(settings, 'ORDER_PENDING_TTL', 60 * 60)
+ORDER_EXPIRY_BATCH_SIZE = getattr(settings, 'ORDER_EXPIRY_BATCH_SIZE', 500)
+ORDER_EXPIRY_PAUSE = getattr(settings, 'ORDER_EXPIRY_PAUSE', 0.1)
+
+
+class CartError(ValueError):
+    """购物车数据错误"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_cart_items(items):
+    """
+    校验并合并购物车明细
+    返回 [(goods_id, quantity), ...]，同一商品的数量会被合并
+    """
+    if not isinstance(items, list) or not items:
+        raise CartError('缺少商品明细')
+    if len(items) > MAX_CART_ITEMS:
+        raise CartError(f'单次最多结算{MAX_CART_ITEMS}种商品')
+
+    merged = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise CartError('商品明细格式错误')
+        try:
+            goods_id = int(item.get('goods_id'))
+            quantity = int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise CartError('商品明细格式错误')
+        if quantity <= 0:
+            raise CartError('商品数量必须大于0')
+        merged[goods_id] = merged.get(goods_id, 0) + quantity
+    return list(merged.items())
+
+
+def place_order(user, lines, receiver_name, receiver_phone,
+                receiver_address):
+    """
+    创建订单及明细，返回 (订单, 明细列表)
+    一次 in_bulk 查询获取全部商品，服务端计算金额，
+    订单、明细与库存预占在同一个事务中写入（明细使用 bulk_create）
+    """
+    goods_map = Goods.objects.filter(is_active=True).in_bulk(
+        [goods_id for goods_id, _ in lines]
+    )
+    missing = [goods_id for goods_id, _ in lines if goods_id not in goods_map]
+    if missing:
+        raise CartError('商品不存在', status=404)
+
+    items = []
+    total_amount = 0
+    total_quantity = 0
+    for goods_id, quantity in lines:
+        goods = goods_map[goods_id]
+        amount = goods.price * quantity
+        total_amount += amount
+        total_quantity += quantity
+        items.append(OrderItem(
+            goods=goods,
+            quantity=quantity,
+            price=goods.price,
+            total_amount=amount
+        ))
+
+    try:
+        with transaction.atomic():
+            order = Order(
+                user=user,
+                goods=items[0].goods,
+                quantity=total_quantity,
+                total_amount=total_amount,
+                receiver_name=receiver_name,
+                receiver_phone=receiver_phone,
+                receiver_address=receiver_address
+            )
+            order.save()
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+            reserve_stock(
+                order, [(item.goods, item.quantity) for item in items]
+            )
+    except InsufficientStock as e:
+        raise CartError(f'商品 {goods_map[e.goods_id].name} 库存不足', 409)
+
+    ORDERS_CREATED.inc()
+    return order, items
+
+
+def payment_deadline(order):
+    """待支付订单的超时取消时间，之后不应再能完成支付"""
+    return order.created_at + timedelta(seconds=ORDER_PENDING_TTL)
+
+
+def mark_order_paid(order_number, transaction_id):
+    """
+    支付成功回调处理，返回 'paid' / 'refund' / 'duplicate' / 'missing'
+    重复回调只做一次索引查询，不产生写入；
+    首次回调用一条 UPDATE ... WHERE status = 'pending' 完成状态迁移；
+    订单已超时取消时记录交易号和支付时间并标记待退款（'refund'），
+    订单保持取消状态，由人工退款或恢复
+    """
+    if Order.objects.filter(transaction_id=transaction_id).exists():
+        return 'duplicate'
+
+    paid_at = timezone.now()
+    result = None
+    with transaction.atomic():
+        updated = Order.objects.filter(
+            order_number=order_number, status='pending'
+        ).update(
+            status='paid',
+            transaction_id=transaction_id,
+            paid_at=paid_at
+        )
+        if updated:
+            result = 'paid'
+        elif Order.objects.filter(
+                order_number=order_number, status='cancelled',
+                paid_at__isnull=True
+        ).update(
+            transaction_id=transaction_id,
+            paid_at=paid_at,
+            refund_required=True
+        ):
+            result = 'refund'
+        if result:
+            # 先取出主键：MySQL 不支持 IN (子查询 ... LIMIT 1)
+            order_id = Order.objects.filter(
+                order_number=order_number
+            ).values_list('id', flat=True).first()
+            # 已收款计入当天的支付汇总，取消的订单不计入热销榜
+            record_transition([order_id], 'paid', paid_at)
+            if result == 'paid':
+                commit_order_stock(order_id)
+    if result:
+        return result
+
+    # 订单已处理，同样应答成功以停止微信重试
+    if Order.objects.filter(order_number=order_number).exists():
+        return 'duplicate'
+    return 'missing'
+
+
+def expire_pending_orders(ttl=None, batch_size=None, pause=None, now=None):
+    """
+    取消超时未支付的订单并释放预占库存，返回取消的订单数
+    按 (created_at, id) 键集顺序分块：每块一个短事务，锁定并批量 UPDATE
+    不超过 batch_size 行，块之间暂停 pause 秒，给复制和在线请求留出余量
+    """
+    ttl = ORDER_PENDING_TTL if ttl is None else ttl
+    batch_size = batch_size or ORDER_EXPIRY_BATCH_SIZE
+    pause = ORDER_EXPIRY_PAUSE if pause is None else pause
+    cutoff = (now or timezone.now()) - timedelta(seconds=ttl)
+
+    candidates = Order.objects.filter(
+        status='pending', created_at__lt=cutoff
+    ).order_by('created_at', 'id')
+    last = None
+    total = 0
+    while True:
+        chunk = candidates
+        if last is not None:
+            chunk = chunk.filter(
+                Q(created_at__gt=last[0]) |
+                Q(created_at=last[0], id__gt=last[1])
+            )
+        rows = list(chunk.values_list('created_at', 'id')[:batch_size])
+        if not rows:
+            break
+        last = rows[-1]
+
+        with transaction.atomic():
+            # 只取消加锁时仍待支付的订单，期间已支付的订单不受影响
+            order_ids = list(
+                Order.objects.select_for_update()
+                .filter(id__in=[pk for _, pk in rows], status='pending')
+                .values_list('id', flat=True)
+            )
+            if order_ids:
+                cancelled_at = timezone.now()
+                Order.objects.filter(id__in=order_ids).update(
+                    status='cancelled', cancelled_at=cancelled_at
+                )
+                record_transition(order_ids, 'cancelled', cancelled_at)
+                release_orders_stock(order_ids)
+        total += len(order_ids)
+
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
@@ -0,0 +1,108 @@
+import base64
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+
+class InvalidCursor(ValueError):
+    """游标格式错误"""
+
+
+def encode_cursor(created_at, pk):
+    """将 (created_at, id) 编码为不透明游标"""
+    raw = f"{created_at.isoformat()}|{pk}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (created_at, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def parse_page_size(value):
+    """解析每页条数，超出上限时截断"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _instance_cursor_key(item):
+    return item.created_at, item.pk
+
+
+def paginate_by_cursor(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                       cursor_key=_instance_cursor_key):
+    """
+    基于 (created_at, id) 的游标分页（倒序）
+    多取一条判断是否还有下一页，任意页的代价与第一页相同
+    queryset 为 values_list 查询集时，用 cursor_key 从元组中取 (created_at, id)
+    返回 (当前页对象列表, 下一页游标, 是否还有更多)
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) |
+            Q(created_at=created_at, id__lt=pk)
+        )
+
+    items = list(queryset[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(*cursor_key(items[-1]))
+    return items, next_cursor, has_more
+
+
+def estimated_row_count(model, using='default'):
+    """读取数据库统计信息中的估算行数，不支持的数据库返回 None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = (
+            'SELECT TABLE_ROWS FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        )
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    大表分页器
+    无筛选条件时使用表统计信息的估算行数，避免全表 COUNT(*)；
+    有筛选条件时最多计数到 count_cap 行
+    """
+    exact_count_threshold = 10000
+    count_cap = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_count_threshold:
+                return estimate
+        return queryset.order_by()[:self.count_cap].count()
@@ -0,0 +1,168 @@
+"""
+微信支付预下单
+
+prepay_id 连同过期时间保存在订单上，有效期内再次发起支付直接复用，
+只需重新生成前端 paySign；下单成功后在后台预先调用统一下单，
+用户点击支付时通常无需再请求微信。
+统一下单传入 time_expire（订单超时取消的时间），prepay_id 的复用期限也不超过它，
+订单取消后用户无法再完成支付。
+"""
+import hashlib
+import logging
+import random
+import string
+import time
+import xml.etree.ElementTree as ET
+from datetime import timedelta
+from xml.sax.saxutils import escape
+from zoneinfo import ZoneInfo
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from shop import wechat
+from shop.models import Order
+from shop.orders import payment_deadline
+
+
+logger = logging.getLogger(__name__)
+
+# 微信支付配置（实际项目中应从环境变量获取）
+WECHAT_PAY_APPID = getattr(settings, 'WECHAT_PAY_APPID', 'YOUR_WECHAT_APPID')
+WECHAT_PAY_MCH_ID = getattr(settings, 'WECHAT_PAY_MCH_ID', 'YOUR_MCH_ID')
+WECHAT_PAY_API_KEY = getattr(settings, 'WECHAT_PAY_API_KEY', 'YOUR_API_KEY')
+WECHAT_PAY_NOTIFY_URL = getattr(
+    settings, 'WECHAT_PAY_NOTIFY_URL',
+    'http://your-domain.com/shop/wechat_pay_notify/'
+)
+# prepay_id 有效期为 2 小时，提前几分钟视为过期，避免用户支付时恰好失效
+WECHAT_PREPAY_TTL = getattr(settings, 'WECHAT_PREPAY_TTL', 110 * 60)
+# 微信要求订单失效时间距下单至少 5 分钟，剩余时间不足时不再发起支付
+WECHAT_PREPAY_MIN_TTL = getattr(settings, 'WECHAT_PREPAY_MIN_TTL', 5 * 60)
+
+# time_expire 为北京时间
+_WECHAT_TZ = ZoneInfo('Asia/Shanghai')
+
+_NONCE_CHARS = string.ascii_lowercase + string.digits
+
+
+class PaymentError(Exception):
+    """统一下单返回失败"""
+
+
+def nonce_str():
+    return ''.join(random.choices(_NONCE_CHARS, k=32))
+
+
+def sign(params, api_key=None):
+    """微信支付 MD5 签名：参数按名称 ASCII 码排序后拼接密钥"""
+    sign_str = '&'.join(f"{k}={v}" for k, v in sorted(params.items()))
+    sign_str += f"&key={api_key or WECHAT_PAY_API_KEY}"
+    return hashlib.md5(sign_str.encode('utf-8')).hexdigest().upper()
+
+
+def pay_params(prepay_id):
+    """生成前端调起支付所需参数"""
+    params = {
+        'appId': WECHAT_PAY_APPID,
+        'timeStamp': str(int(time.time())),
+        'nonceStr': nonce_str(),
+        'package': f"prepay_id={prepay_id}",
+        'signType': 'MD5'
+    }
+    params['paySign'] = sign(params)
+    return params
+
+
+def prepay_valid(order, now=None):
+    """订单上保存的 prepay_id 是否仍可使用"""
+    return bool(
+        order.prepay_id and order.prepay_expires_at
+        and order.prepay_expires_at > (now or timezone.now())
+    )
+
+
+async def request_prepay(order, goods_name, openid, client_ip):
+    """
+    调用统一下单接口，保存并返回 prepay_id
+    失效时间为订单的超时取消时间，剩余时间不足时抛出 PaymentError
+    """
+    deadline = payment_deadline(order)
+    now = timezone.now()
+    if deadline - now < timedelta(seconds=WECHAT_PREPAY_MIN_TTL):
+        raise PaymentError('订单即将超时取消，请重新下单')
+    params = {
+        'appid': WECHAT_PAY_APPID,
+        'mch_id': WECHAT_PAY_MCH_ID,
+        'nonce_str': nonce_str(),
+        'body': f"商品购买 - {goods_name}",
+        'out_trade_no': order.order_number,
+        'total_fee': int(order.total_amount * 100),  # 转换为分
+        'spbill_create_ip': client_ip,
+        'notify_url': WECHAT_PAY_NOTIFY_URL,
+        'trade_type': 'JSAPI',
+        'openid': openid,
+        'time_expire': deadline.astimezone(_WECHAT_TZ).strftime(
+            '%Y%m%d%H%M%S'
+        ),
+    }
+    params['sign'] = sign(params)
+    xml_data = '<xml>' + ''.join(
+        f'<{k}>{escape(str(v))}</{k}>' for k, v in params.items()
+    ) + '</xml>'
+
+    content = await wechat.unifiedorder(xml_data.encode('utf-8'))
+    root = ET.fromstring(content)
+    if (root.findtext('return_code') != 'SUCCESS'
+            or root.findtext('result_code') != 'SUCCESS'):
+        raise PaymentError(
+            root.findtext('err_code_des') or root.findtext('return_msg')
+            or '未知错误'
+        )
+
+    order.prepay_id = root.findtext('prepay_id')
+    order.prepay_expires_at = min(
+        timezone.now() + timedelta(seconds=WECHAT_PREPAY_TTL), deadline
+    )
+    await Order.objects.filter(id=order.id, status='pending').aupdate(
+        prepay_id=order.prepay_id,
+        prepay_expires_at=order.prepay_expires_at
+    )
+    return order.prepay_id
+
+
+async def ensure_prepay(order, goods_name, openid, client_ip):
+    """有效期内复用已有 prepay_id，否则重新统一下单"""
+    if prepay_valid(order):
+        return order.prepay_id
+    return await request_prepay(order, goods_name, openid, client_ip)
+
+
+async def precreate_prepay(order_id, client_ip):
+    """后台预下单；失败不影响用户，点击支付时会重新下单"""
+    try:
+        order = await Order.objects.select_related('goods', 'user').aget(
+            id=order_id, status='pending'
+        )
+        await ensure_prepay(
+            order, order.goods.name, order.user.openid, client_ip
+        )
+    except (Order.DoesNotExist, wechat.WechatError, PaymentError) as e:
+        logger.warning('订单 %s 预下单失败: %s', order_id, e)
+    except Exception:
+        logger.exception('订单 %s 预下单失败', order_id)
+    finally:
+        await sync_to_async(close_old_connections)()
+
+
+def schedule_prepay(order, client_ip):
+    """
+    订单提交后在后台预先调用统一下单
+    在微信客户端的常驻事件循环中执行，复用其连接池
+    """
+    order_id = order.id
+    transaction.on_commit(lambda: wechat.submit(
+        precreate_prepay(order_id, client_ip)
+    ))
@@ -0,0 +1,155 @@
+"""
+请求级 SQL 统计
+
+QueryAccountingMiddleware 在每个请求期间记录 SQL 数量、数据库耗时和视图耗时，
+通过 Server-Timing 响应头返回（浏览器开发者工具可直接查看）。
+同一条 SQL（Django 生成的 SQL 参数为占位符，文本相同即形状相同）
+在一个请求中重复执行达到阈值时记录疑似 N+1；
+慢请求按采样率记录耗时最多的几条 SQL。
+每条 SQL 只增加两次计时和一次字典更新，可在生产环境常开。
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_ACCOUNTING_ENABLED = getattr(settings, 'QUERY_ACCOUNTING_ENABLED', True)
+# 是否向客户端返回 Server-Timing 头
+SERVER_TIMING_HEADER = getattr(settings, 'SERVER_TIMING_HEADER', True)
+# 同一 SQL 在一个请求内重复执行多少次视为疑似 N+1
+QUERY_NPLUSONE_THRESHOLD = getattr(settings, 'QUERY_NPLUSONE_THRESHOLD', 5)
+# 慢请求阈值（秒）与记录采样率
+SLOW_REQUEST_THRESHOLD = getattr(settings, 'SLOW_REQUEST_THRESHOLD', 0.5)
+SLOW_REQUEST_SAMPLE_RATE = getattr(settings, 'SLOW_REQUEST_SAMPLE_RATE', 0.1)
+SLOW_REQUEST_TOP_QUERIES = 5
+
+
+class QueryStats:
+    """作为 execute_wrapper 记录一个请求内执行的 SQL"""
+    __slots__ = ('count', 'duration', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # SQL -> [执行次数, 累计耗时]
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            entry = self.shapes.get(sql)
+            if entry is None:
+                self.shapes[sql] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def repeated(self, threshold):
+        """重复次数达到阈值的 SQL，按次数倒序 [(sql, 次数, 耗时)]"""
+        return sorted(
+            ((sql, n, d) for sql, (n, d) in self.shapes.items()
+             if n >= threshold),
+            key=lambda item: -item[1]
+        )
+
+    def top(self, limit):
+        """累计耗时最多的 SQL [(sql, 次数, 耗时)]"""
+        return sorted(
+            ((sql, n, d) for sql, (n, d) in self.shapes.items()),
+            key=lambda item: -item[2]
+        )[:limit]
+
+
+def server_timing(stats, elapsed, repeated):
+    metrics = [
+        f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"',
+        f'view;dur={elapsed * 1000:.2f}',
+    ]
+    if repeated:
+        metrics.append(f'nplusone;desc="{repeated[0][1]}x"')
+    return ', '.join(metrics)
+
+
+def _format_queries(queries):
+    return '\n'.join(
+        f'  {n}x {d * 1000:.2f}ms  {sql[:300]}' for sql, n, d in queries
+    )
+
+
+class QueryAccountingMiddleware:
+    """记录每个请求的 SQL 数量与耗时，同时支持同步和异步调用链"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not QUERY_ACCOUNTING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        # 供 MetricsMiddleware 读取
+        request.query_stats = stats
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            self.install(stack, stats)
+            response = self.get_response(request)
+        return self.report(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        request.query_stats = stats
+        started = time.perf_counter()
+        # 数据库连接按线程隔离：异步请求的 ORM 调用都在同一个
+        # thread_sensitive 线程中执行，计数包装也要在该线程中安装和移除
+        stack = ExitStack()
+        await sync_to_async(self.install)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, stats, started)
+
+    @staticmethod
+    def install(stack, stats):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+
+    def report(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        repeated = stats.repeated(QUERY_NPLUSONE_THRESHOLD)
+        if SERVER_TIMING_HEADER:
+            response['Server-Timing'] = server_timing(stats, elapsed, repeated)
+        if repeated:
+            logger.warning(
+                '疑似 N+1 查询: %s %s\n%s',
+                request.method, request.path, _format_queries(repeated)
+            )
+        if (elapsed >= SLOW_REQUEST_THRESHOLD
+                and random.random() < SLOW_REQUEST_SAMPLE_RATE):
+            logger.warning(
+                '慢请求 %s %s: %.0fms, %d queries, db %.0fms\n%s',
+                request.method, request.path, elapsed * 1000, stats.count,
+                stats.duration * 1000,
+                _format_queries(stats.top(SLOW_REQUEST_TOP_QUERIES))
+            )
+        return response
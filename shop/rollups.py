@@ -0,0 +1,309 @@
+"""
+销售日汇总
+
+订单进入已支付/已完成/已取消状态时，在同一事务中把订单数、件数和金额
+累加到当天（按 TIME_ZONE 的自然日）的按状态、按商品、按标签三张汇总表；
+报表只读取汇总表，不再对订单表做全表 GROUP BY。
+每种状态对应订单上的一个时间字段，时间字段为空时才记为一次新的迁移，
+因此增量累加的结果与按订单数据重建（backfill_sales_rollups）一致。
+"""
+import time
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from shop.bestsellers import record_sales, remove_sales
+from shop.metrics import count_order_transition
+from shop.models import (
+    DailyGoodsSales, DailySales, DailyTagSales, Goods, Order, OrderItem, Tag
+)
+
+
+ROLLUP_STATUSES = ('paid', 'completed', 'cancelled')
+# 订单状态 -> 进入该状态的时间字段
+TRANSITION_FIELDS = {
+    'paid': 'paid_at',
+    'completed': 'completed_at',
+    'cancelled': 'cancelled_at',
+}
+# 处于这些状态的订单一定已支付（兼容没有 paid_at 的历史订单）
+PAID_STATUSES = ('paid', 'shipped', 'completed')
+
+ORDER_FIELDS = (
+    'id', 'status', 'goods_id', 'goods__tag_id', 'quantity', 'total_amount',
+    'created_at', 'paid_at', 'completed_at', 'cancelled_at',
+)
+
+# 三张汇总表及其维度字段
+TABLES = (
+    (DailySales, ('day', 'status')),
+    (DailyGoodsSales, ('day', 'status', 'goods_id')),
+    (DailyTagSales, ('day', 'status', 'tag_id')),
+)
+
+
+def _add(totals, key, orders, quantity, amount):
+    entry = totals.get(key)
+    if entry is None:
+        totals[key] = [orders, quantity, amount]
+    else:
+        entry[0] += orders
+        entry[1] += quantity
+        entry[2] += amount
+
+
+class Rollup:
+    """在内存中累加一批订单迁移，按表保存 {维度: [订单数, 件数, 金额]}"""
+
+    def __init__(self):
+        self.totals = {model: {} for model, _ in TABLES}
+
+    def add(self, day, status, order, lines):
+        """
+        order 为订单数据（ORDER_FIELDS），lines 为 [(商品ID, 标签ID, 件数, 金额)]
+        一个订单在同一商品/标签下只计一单
+        """
+        _add(self.totals[DailySales], (day, status), 1,
+             order['quantity'], order['total_amount'])
+        per_goods = {}
+        per_tag = {}
+        for goods_id, tag_id, quantity, amount in lines:
+            _add(per_goods, goods_id, 1, quantity, amount)
+            _add(per_tag, tag_id, 1, quantity, amount)
+        for goods_id, (_, quantity, amount) in per_goods.items():
+            _add(self.totals[DailyGoodsSales], (day, status, goods_id), 1,
+                 quantity, amount)
+        for tag_id, (_, quantity, amount) in per_tag.items():
+            _add(self.totals[DailyTagSales], (day, status, tag_id), 1,
+                 quantity, amount)
+
+    def apply(self):
+        """
+        累加到汇总表，需在订单状态更新的事务中调用
+        按维度排序后逐行 UPDATE ... SET x = x + ?，行不存在时插入；
+        固定的加锁顺序避免并发迁移之间死锁
+        """
+        for model, fields in TABLES:
+            for key, (orders, quantity, amount) in sorted(
+                    self.totals[model].items()):
+                lookup = dict(zip(fields, key))
+                increments = {
+                    'orders': F('orders') + orders,
+                    'quantity': F('quantity') + quantity,
+                    'amount': F('amount') + amount,
+                }
+                if model.objects.filter(**lookup).update(**increments):
+                    continue
+                try:
+                    with transaction.atomic():
+                        model.objects.create(
+                            **lookup, orders=orders, quantity=quantity,
+                            amount=amount
+                        )
+                except IntegrityError:
+                    # 并发事务已插入该行
+                    model.objects.filter(**lookup).update(**increments)
+
+    def rows(self, model):
+        """生成汇总表的模型实例（用于重建）"""
+        fields = dict(TABLES)[model]
+        for key, (orders, quantity, amount) in self.totals[model].items():
+            yield model(
+                **dict(zip(fields, key)), orders=orders, quantity=quantity,
+                amount=amount
+            )
+
+
+def load_orders(queryset):
+    """
+    读取订单及其明细，返回 [(订单数据, 明细)]
+    没有明细的历史订单以订单上的商品、数量和金额作为唯一明细
+    """
+    orders = list(queryset.values(*ORDER_FIELDS))
+    lines = {}
+    items = OrderItem.objects.filter(
+        order_id__in=[order['id'] for order in orders]
+    ).values_list(
+        'order_id', 'goods_id', 'goods__tag_id', 'quantity', 'total_amount'
+    )
+    for order_id, *line in items:
+        lines.setdefault(order_id, []).append(line)
+    return [
+        (order, lines.get(order['id']) or [(
+            order['goods_id'], order['goods__tag_id'], order['quantity'],
+            order['total_amount']
+        )])
+        for order in orders
+    ]
+
+
+def record_transition(order_ids, status, when=None):
+    """
+    订单 order_ids（ID 列表或子查询）已于 when 进入 status，累加到当天汇总，
+    支付时同时累加热销榜销量（取消后才收款的订单除外），
+    已支付的订单被取消时从热销榜扣除；需在更新订单状态的事务中调用
+    """
+    when = when or timezone.now()
+    day = timezone.localdate(when)
+    rollup = Rollup()
+    orders = load_orders(Order.objects.filter(id__in=order_ids).order_by())
+    for order, lines in orders:
+        rollup.add(day, status, order, lines)
+    rollup.apply()
+    if status == 'paid':
+        record_sales([
+            line for order, lines in orders
+            if order['status'] != 'cancelled' for line in lines
+        ], when)
+    elif status == 'cancelled':
+        for order, lines in orders:
+            if order['paid_at'] and order['paid_at'] <= when:
+                remove_sales(lines, order['paid_at'])
+    count_order_transition(status, len(orders))
+    return len(orders)
+
+
+def stamp_transitions(order, now=None):
+    """
+    订单状态被手工修改（后台）时补齐对应的时间字段，
+    返回新发生的迁移 [(状态, 时间)]，保存订单后交给 record_transition
+    """
+    now = now or timezone.now()
+    events = []
+    statuses = [order.status]
+    if order.status in PAID_STATUSES and order.status != 'paid':
+        statuses.insert(0, 'paid')
+    for status in statuses:
+        field = TRANSITION_FIELDS.get(status)
+        if field and getattr(order, field) is None:
+            setattr(order, field, now)
+            events.append((status, now))
+    return events
+
+
+def order_transitions(order):
+    """按订单当前数据推出已发生的迁移 [(状态, 时间)]，用于重建"""
+    fallback = order['created_at']
+    if order['paid_at'] or order['status'] in PAID_STATUSES:
+        yield 'paid', order['paid_at'] or fallback
+    if order['completed_at'] or order['status'] == 'completed':
+        yield 'completed', (
+            order['completed_at'] or order['paid_at'] or fallback
+        )
+    if order['cancelled_at'] or order['status'] == 'cancelled':
+        yield 'cancelled', order['cancelled_at'] or fallback
+
+
+def rebuild_rollups(start=None, until=None, chunk_size=2000, pause=0.0,
+                    progress=None):
+    """
+    按订单数据重建 [start, until) 日期范围内的汇总，返回扫描的订单数
+    按主键分段读取订单（每段两次查询），在内存中累加，
+    最后在一个事务中替换该日期范围内的汇总行；
+    until 默认为今天且不能晚于今天，今天的汇总保持增量累加的结果，不与重建竞争。
+    替换前锁定范围内的按状态汇总行（增量累加总是先写这张表），
+    跨零点仍在提交的迁移先完成，之后的累加等待替换结束
+    """
+    today = timezone.localdate()
+    until = until or today
+    if until > today:
+        raise ValueError('截止日期不能晚于今天')
+    rollup = Rollup()
+    queryset = Order.objects.order_by('id')
+    last_id = 0
+    scanned = 0
+    while True:
+        chunk = load_orders(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        for order, lines in chunk:
+            for status, when in order_transitions(order):
+                day = timezone.localdate(when)
+                if (start is None or day >= start) and day < until:
+                    rollup.add(day, status, order, lines)
+        last_id = chunk[-1][0]['id']
+        scanned += len(chunk)
+        if progress:
+            progress(scanned)
+        if len(chunk) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    with transaction.atomic():
+        locked = DailySales.objects.select_for_update().filter(day__lt=until)
+        if start is not None:
+            locked = locked.filter(day__gte=start)
+        list(locked.values_list('id', flat=True))
+        for model, _ in TABLES:
+            existing = model.objects.filter(day__lt=until)
+            if start is not None:
+                existing = existing.filter(day__gte=start)
+            existing.delete()
+            model.objects.bulk_create(
+                rollup.rows(model), batch_size=chunk_size
+            )
+    return scanned
+
+
+def _ranking(model, field, names, start, end, limit):
+    rows = (
+        model.objects.filter(day__gte=start, day__lte=end, status='paid')
+        .values(field)
+        .annotate(
+            total_orders=Sum('orders'), total_quantity=Sum('quantity'),
+            total_amount=Sum('amount')
+        )
+        .order_by('-total_amount')[:limit]
+    )
+    labels = names.in_bulk([row[field] for row in rows])
+    return [
+        {
+            'id': row[field],
+            'name': str(labels.get(row[field], row[field])),
+            'orders': row['total_orders'],
+            'quantity': row['total_quantity'],
+            'amount': row['total_amount'],
+        }
+        for row in rows
+    ]
+
+
+def sales_report(start, end, limit=20):
+    """
+    [start, end] 日期范围的销售报表，只读取汇总表
+    每日汇总与区间合计中各状态的数据按 ROLLUP_STATUSES 顺序排列，
+    商品和标签按支付金额排名
+    """
+    def empty():
+        return {'orders': 0, 'quantity': 0, 'amount': Decimal('0')}
+
+    index = {status: i for i, status in enumerate(ROLLUP_STATUSES)}
+    days = {}
+    totals = [empty() for _ in ROLLUP_STATUSES]
+    rows = DailySales.objects.filter(
+        day__gte=start, day__lte=end
+    ).values_list('day', 'status', 'orders', 'quantity', 'amount')
+    for day, status, orders, quantity, amount in rows:
+        values = days.setdefault(day, [empty() for _ in ROLLUP_STATUSES])
+        for entry in (values[index[status]], totals[index[status]]):
+            entry['orders'] += orders
+            entry['quantity'] += quantity
+            entry['amount'] += amount
+    return {
+        'daily': [
+            {'day': day, 'values': days[day]}
+            for day in sorted(days, reverse=True)
+        ],
+        'totals': totals,
+        'top_goods': _ranking(
+            DailyGoodsSales, 'goods_id', Goods.objects.only('name'),
+            start, end, limit
+        ),
+        'top_tags': _ranking(
+            DailyTagSales, 'tag_id', Tag.objects.only('name'),
+            start, end, limit
+        ),
+    }
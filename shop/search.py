@@ -0,0 +1,168 @@
+"""
+商品全文搜索（进程内倒排索引）
+
+索引覆盖上架商品的名称、描述和逗号分隔的标签。中文按单字和二元组切分，
+英文/数字按单词切分，结果按 TF-IDF 加权并对命中全部查询词的商品加权排序。
+每个 worker 首次查询时构建索引，之后由 Goods 的保存/删除信号增量更新；
+其他进程的修改通过商品目录版本号发现，版本不一致时重建。
+"""
+import heapq
+import math
+import re
+import threading
+
+from shop.cache import get_catalog_version
+from shop.models import Goods
+from shop.serializers import serialize_goods
+
+
+FIELD_WEIGHTS = (
+    ('name', 3.0),
+    ('tags', 2.0),
+    ('desc', 1.0),
+)
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[\u4e00-\u9fff]+')
+
+
+def tokenize(text, query=False):
+    """
+    切分文本
+    索引时中文连续片段同时产生单字和二元组；
+    查询时长度不小于2的中文片段只取二元组，以提高准确度
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if run.isascii():
+            tokens.append(run)
+            continue
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if query and bigrams:
+            tokens.extend(bigrams)
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    return tokens
+
+
+def _document_weights(good):
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        value = getattr(good, field)
+        if field == 'tags':
+            value = ' '.join((value or '').split(','))
+        for token in tokenize(value):
+            weights[token] = weights.get(token, 0.0) + weight
+    return weights
+
+
+class GoodsSearchIndex:
+    """商品倒排索引"""
+
+    def __init__(self):
+        self.version = None
+        self.postings = {}
+        self.documents = {}
+        self._lock = threading.Lock()
+
+    def build(self):
+        """从数据库全量构建索引"""
+        version = get_catalog_version()
+        postings = {}
+        documents = {}
+        for good in Goods.objects.filter(is_active=True).order_by('id'):
+            weights = _document_weights(good)
+            documents[good.id] = (serialize_goods(good), weights)
+            for token, weight in weights.items():
+                postings.setdefault(token, {})[good.id] = weight
+        with self._lock:
+            self.postings = postings
+            self.documents = documents
+            self.version = version
+
+    def ensure_fresh(self):
+        """索引未构建或目录版本已变化时重建"""
+        if self.version != get_catalog_version():
+            self.build()
+
+    def _remove(self, goods_id):
+        # 写时复制：读请求可能正在遍历旧的倒排列表
+        _, weights = self.documents.pop(goods_id, (None, {}))
+        for token in weights:
+            posting = dict(self.postings.get(token, {}))
+            posting.pop(goods_id, None)
+            if posting:
+                self.postings[token] = posting
+            else:
+                self.postings.pop(token, None)
+
+    def _adopt_version(self, version):
+        # 本次修改前索引恰好是最新版本时才跟进版本号；
+        # 期间若有其他进程的修改，保留旧版本号，下次查询时重建
+        if self.version == version - 1:
+            self.version = version
+
+    def update(self, good, version):
+        """
+        增量更新单个商品（保存信号中调用）
+        version 为本次修改递增后的目录版本号
+        """
+        if self.version is None:
+            return
+        with self._lock:
+            self._remove(good.id)
+            if good.is_active:
+                weights = _document_weights(good)
+                self.documents[good.id] = (serialize_goods(good), weights)
+                for token, weight in weights.items():
+                    posting = dict(self.postings.get(token, {}))
+                    posting[good.id] = weight
+                    self.postings[token] = posting
+            self._adopt_version(version)
+
+    def remove(self, goods_id, version):
+        """从索引中移除商品（删除信号中调用）"""
+        if self.version is None:
+            return
+        with self._lock:
+            self._remove(goods_id)
+            self._adopt_version(version)
+
+    def search(self, query, tag_id=None, limit=20):
+        """搜索商品，返回按相关度排序的商品数据列表"""
+        self.ensure_fresh()
+        tokens = set(tokenize(query, query=True))
+        if not tokens:
+            return []
+
+        postings = self.postings
+        documents = self.documents
+        total = len(documents) or 1
+        scores = {}
+        matched = {}
+        for token in tokens:
+            posting = postings.get(token)
+            if not posting:
+                continue
+            idf = math.log(1 + total / len(posting))
+            for goods_id, weight in posting.items():
+                scores[goods_id] = scores.get(goods_id, 0.0) + weight * idf
+                matched[goods_id] = matched.get(goods_id, 0) + 1
+
+        ranked = []
+        for goods_id, score in scores.items():
+            document = documents.get(goods_id)
+            if document is None:
+                continue
+            payload = document[0]
+            if tag_id is not None and payload['tag'] != tag_id:
+                continue
+            coverage = matched[goods_id] / len(tokens)
+            ranked.append((score * coverage * coverage, -goods_id, payload))
+        return [
+            dict(payload, score=round(score, 4))
+            for score, _, payload in heapq.nlargest(limit, ranked)
+        ]
+
+
+goods_index = GoodsSearchIndex()
@@ -0,0 +1,147 @@
+"""
+接口序列化
+
+每个接口的字段投影器在模块加载时生成一次：直接把 values_list 返回的元组
+按位置转为字典（必要时做类型转换），再交给 JSON 后端编码。
+安装了 orjson 时使用 orjson，否则回退到标准库 json。
+"""
+import json
+from decimal import Decimal
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from shop.models import Order
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'无法序列化 {type(value).__name__}')
+
+
+def dumps(data):
+    """编码为 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """使用快速 JSON 后端的响应"""
+    return HttpResponse(
+        dumps(data), status=status, content_type='application/json'
+    )
+
+
+def to_float(value):
+    return float(value)
+
+
+def to_isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class Projector:
+    """
+    字段投影器
+    fields 为 (接口字段, 数据库列, 转换函数或 None)，
+    初始化时生成把 values_list 元组转为字典的函数：
+    按位置 zip 出字典，再只对需要转换的少数字段调用转换函数
+    """
+
+    def __init__(self, fields):
+        self.keys = tuple(key for key, _, _ in fields)
+        self.columns = tuple(column for _, column, _ in fields)
+        self.project = self._projector(fields)
+
+    def _projector(self, fields):
+        keys = self.keys
+        converters = tuple(
+            (key, itemgetter(index), convert)
+            for index, (key, _, convert) in enumerate(fields)
+            if convert is not None
+        )
+        if not converters:
+            def project(row):
+                return dict(zip(keys, row))
+        else:
+            def project(row):
+                item = dict(zip(keys, row))
+                for key, get, convert in converters:
+                    item[key] = convert(get(row))
+                return item
+        return project
+
+    def index(self, column):
+        """数据库列在元组中的下标"""
+        return self.columns.index(column)
+
+    def values(self, queryset):
+        """按投影列取值的查询集"""
+        return queryset.values_list(*self.columns)
+
+    def rows(self, queryset):
+        """查询并投影为字典列表"""
+        project = self.project
+        return [project(row) for row in self.values(queryset)]
+
+
+TAG_PROJECTOR = Projector((
+    ('id', 'id', None),
+    ('name', 'name', None),
+    ('is_active', 'is_active', None),
+    ('sequence', 'sequence', None),
+))
+
+GOODS_PROJECTOR = Projector((
+    ('id', 'id', None),
+    ('name', 'name', None),
+    ('is_active', 'is_active', None),
+    ('price', 'price', None),
+    ('tag', 'tag_id', None),
+    ('desc', 'desc', None),
+    ('tags', 'tag_list', None),
+    ('url', 'image_url', None),
+    ('images', 'images', None),
+))
+
+ORDER_STATUS_DISPLAY = {
+    key: str(label) for key, label in Order.ORDER_STATUS_CHOICES
+}
+
+
+def _status_display(status):
+    return ORDER_STATUS_DISPLAY.get(status, status)
+
+
+ORDER_PROJECTOR = Projector((
+    ('id', 'id', None),
+    ('order_number', 'order_number', None),
+    ('goods_name', 'goods__name', None),
+    ('quantity', 'quantity', None),
+    ('total_amount', 'total_amount', to_float),
+    ('status', 'status', None),
+    ('status_display', 'status', _status_display),
+    ('created_at', 'created_at', to_isoformat),
+    ('paid_at', 'paid_at', to_isoformat),
+))
+
+
+def goods_rows(queryset):
+    """按接口字段投影商品查询集"""
+    return GOODS_PROJECTOR.rows(queryset)
+
+
+def serialize_goods(good):
+    """商品接口返回的单个商品数据"""
+    return {
+        key: getattr(good, column)
+        for key, column in zip(GOODS_PROJECTOR.keys, GOODS_PROJECTOR.columns)
+    }
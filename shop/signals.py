@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from shop.cache import bump_catalog_version
+from shop.images import schedule_goods_images
+from shop.models import Goods, Order, Tag
+from shop.search import goods_index
+from shop.stock import commit_order_stock, release_order_stock
+
+
+# 订单支付成功（回调队列处理完成）后发送，参数: order_number, transaction_id
+order_paid = Signal()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Goods)
+@receiver(post_delete, sender=Goods)
+def invalidate_catalog_cache(sender, instance, signal, **kwargs):
+    """
+    标签或商品变更（含后台 list_editable 批量编辑）后使目录缓存失效，
+    商品变更同时增量更新本进程的搜索索引
+    在事务提交后执行：提交前递增版本会让并发请求把旧数据写入新版本的缓存，
+    事务回滚时也不应修改索引
+    """
+    goods_id = instance.id
+    deleted = signal is post_delete
+
+    def invalidate():
+        version = bump_catalog_version()
+        if sender is Goods:
+            if deleted:
+                goods_index.remove(goods_id, version)
+            else:
+                goods_index.update(instance, version)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Goods)
+def generate_goods_images(sender, instance, **kwargs):
+    """商品原图变更后在后台生成衍生图"""
+    schedule_goods_images(instance)
+
+
+@receiver(post_save, sender=Order)
+def sync_order_stock(sender, instance, **kwargs):
+    """订单取消时释放预占库存，支付后确认预占"""
+    if instance.status == 'cancelled':
+        release_order_stock(instance.id)
+    elif instance.status in ('paid', 'shipped', 'completed'):
+        commit_order_stock(instance.id)
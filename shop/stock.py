@@ -0,0 +1,227 @@
+"""
+库存分片与预占
+
+每个商品的库存拆分为 STOCK_SHARDS 个分片，下单时随机选择分片做条件扣减
+（UPDATE ... WHERE available >= ?），抢购流量被分散到多行，避免单行锁排队。
+单个分片不足时退化为按固定顺序锁定全部分片合并扣减。
+分片间的不均衡由 reconcile_stock 定期重新均分。
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from shop.models import Goods, StockReservation, StockShard
+
+
+STOCK_SHARDS = getattr(settings, 'STOCK_SHARDS', 8)
+# 预占与待支付订单同时到期，超时订单由 expire_pending_orders 统一取消并释放预占
+STOCK_RESERVATION_TTL = getattr(settings, 'ORDER_PENDING_TTL', 60 * 60)
+
+
+class InsufficientStock(Exception):
+    """库存不足"""
+
+    def __init__(self, goods_id):
+        super().__init__(f'商品 {goods_id} 库存不足')
+        self.goods_id = goods_id
+
+
+def _split(total, shards):
+    base, extra = divmod(total, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def _fill_shards(goods_id, shards, available):
+    """把可售数量均分到已加锁的分片（分片不全时重建），并回写 Goods.stock"""
+    if len(shards) == STOCK_SHARDS:
+        for s, amount in zip(shards, _split(available, STOCK_SHARDS)):
+            s.available = amount
+        StockShard.objects.bulk_update(shards, ['available'])
+    else:
+        StockShard.objects.filter(goods_id=goods_id).delete()
+        StockShard.objects.bulk_create([
+            StockShard(goods_id=goods_id, shard=shard, available=amount)
+            for shard, amount in enumerate(_split(available, STOCK_SHARDS))
+        ])
+    Goods.objects.filter(id=goods_id).update(stock=available)
+
+
+def set_stock(goods_id, quantity):
+    """
+    设置商品库存总量并均匀分配到各分片，quantity 为 None 时不限库存
+    总量包含未支付订单仍在预占的数量，分片中只放入扣除预占后的可售数量，
+    这些预占释放时归还分片，不会使库存虚增；返回可售数量
+    """
+    with transaction.atomic():
+        # 锁定分片，与下单扣减、预占释放串行；分片原地更新，等待中的归还不会丢失
+        shards = list(
+            StockShard.objects.select_for_update()
+            .filter(goods_id=goods_id)
+            .order_by('shard')
+        )
+        if quantity is None:
+            StockShard.objects.filter(goods_id=goods_id).delete()
+            Goods.objects.filter(id=goods_id).update(stock=None)
+            return None
+        reserved = StockReservation.objects.filter(
+            goods_id=goods_id, status='reserved'
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        available = max(quantity - reserved, 0)
+        _fill_shards(goods_id, shards, available)
+    return available
+
+
+def take_stock(goods_id, quantity):
+    """
+    扣减库存，返回 [(分片号, 数量), ...]
+    需在事务中调用，事务回滚时扣减一并撤销
+    """
+    start = random.randrange(STOCK_SHARDS)
+    for offset in range(STOCK_SHARDS):
+        shard = (start + offset) % STOCK_SHARDS
+        updated = StockShard.objects.filter(
+            goods_id=goods_id, shard=shard, available__gte=quantity
+        ).update(available=F('available') - quantity)
+        if updated:
+            return [(shard, quantity)]
+
+    # 没有单个分片能满足时，按分片号顺序加锁后合并扣减
+    shards = list(
+        StockShard.objects.select_for_update()
+        .filter(goods_id=goods_id, available__gt=0)
+        .order_by('shard')
+    )
+    if sum(s.available for s in shards) < quantity:
+        raise InsufficientStock(goods_id)
+
+    taken = []
+    changed = []
+    remaining = quantity
+    for s in shards:
+        amount = min(s.available, remaining)
+        s.available -= amount
+        taken.append((s.shard, amount))
+        changed.append(s)
+        remaining -= amount
+        if not remaining:
+            break
+    StockShard.objects.bulk_update(changed, ['available'])
+    return taken
+
+
+def put_stock(goods_id, shard, quantity):
+    """归还库存到指定分片"""
+    StockShard.objects.filter(goods_id=goods_id, shard=shard).update(
+        available=F('available') + quantity
+    )
+
+
+def reserve_stock(order, lines):
+    """
+    为订单预占库存
+    lines 为 [(goods, quantity), ...]，未设置库存的商品不做限制
+    需在下单事务中调用，库存不足时抛出 InsufficientStock
+    """
+    expires_at = timezone.now() + timedelta(seconds=STOCK_RESERVATION_TTL)
+    reservations = []
+    for goods, quantity in lines:
+        if goods.stock is None:
+            continue
+        for shard, amount in take_stock(goods.id, quantity):
+            reservations.append(StockReservation(
+                order=order,
+                goods_id=goods.id,
+                shard=shard,
+                quantity=amount,
+                expires_at=expires_at
+            ))
+    if reservations:
+        StockReservation.objects.bulk_create(reservations)
+    return reservations
+
+
+def release_order_stock(order_id):
+    """释放订单的预占库存（取消/过期），可重复调用"""
+    return release_orders_stock([order_id])
+
+
+def release_orders_stock(order_ids):
+    """
+    批量释放多个订单的预占库存，可重复调用
+    同一分片的归还数量先合并，每个 (商品, 分片) 只执行一次 UPDATE
+    """
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update()
+            .filter(order_id__in=order_ids, status='reserved')
+            .values_list('id', 'goods_id', 'shard', 'quantity')
+        )
+        returned = {}
+        for _, goods_id, shard, quantity in reservations:
+            key = (goods_id, shard)
+            returned[key] = returned.get(key, 0) + quantity
+        # 按固定顺序加锁，避免并发释放时死锁
+        for (goods_id, shard), quantity in sorted(returned.items()):
+            put_stock(goods_id, shard, quantity)
+        if reservations:
+            StockReservation.objects.filter(
+                id__in=[r[0] for r in reservations]
+            ).update(status='released')
+    return len(reservations)
+
+
+def commit_order_stock(order_id):
+    """
+    订单支付后确认预占，之后不再因过期被释放
+    order_id 也可以是返回订单ID的子查询
+    """
+    return StockReservation.objects.filter(
+        order_id=order_id, status='reserved'
+    ).update(status='committed')
+
+
+def release_expired_reservations(now=None, batch_size=500):
+    """
+    清理过期预占：订单已取消的释放库存，已支付的确认预占
+    待支付订单只由 expire_pending_orders 取消（同时释放预占），这里不做处理
+    返回本批处理的订单数
+    """
+    now = now or timezone.now()
+    orders = list(
+        StockReservation.objects.filter(
+            status='reserved', expires_at__lt=now
+        ).exclude(order__status='pending')
+        .values_list('order_id', 'order__status').distinct()[:batch_size]
+    )
+    for order_id, status in orders:
+        if status == 'cancelled':
+            release_order_stock(order_id)
+        else:
+            commit_order_stock(order_id)
+    return len(orders)
+
+
+def reconcile_stock(goods_id):
+    """对账：将商品剩余库存重新均分到各分片，并回写 Goods.stock"""
+    with transaction.atomic():
+        shards = list(
+            StockShard.objects.select_for_update()
+            .filter(goods_id=goods_id)
+            .order_by('shard')
+        )
+        if not shards:
+            return None
+        total = sum(s.available for s in shards)
+        _fill_shards(goods_id, shards, total)
+    return total
+
+
+def available_stock(goods_id):
+    """查询商品当前可用库存（各分片之和）"""
+    return StockShard.objects.filter(goods_id=goods_id).aggregate(
+        total=Sum('available')
+    )['total']
@@ -0,0 +1,6 @@
+# 测试使用进程内缓存，不依赖也不污染共享的 Redis
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
@@ -0,0 +1,112 @@
+"""
+读写分离路由：只读接口读副本，用户写入或目录变更后读主库
+测试环境只有一个数据库，记录路由器为每次读取选择的连接后仍在主库上执行
+"""
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.test import TestCase, override_settings
+
+from shop import db_router
+from shop.cache import bump_catalog_version
+from shop.models import Goods, Tag, WechatUser
+from shop.tests import TEST_CACHES
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReplicaRoutingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='水果')
+        cls.goods = Goods.objects.create(
+            name='苹果', price=Decimal('1.00'), tag=cls.tag, desc=''
+        )
+        cls.buyer = WechatUser.objects.create(openid='router-buyer')
+        cls.other = WechatUser.objects.create(openid='router-other')
+
+    def setUp(self):
+        cache.clear()
+        self.reads = []
+        route = db_router.PrimaryReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            self.reads.append(route(router, model, **hints))
+            return 'default'
+
+        for patcher in (
+            mock.patch.object(db_router, 'DATABASE_REPLICAS', ['replica']),
+            mock.patch.object(
+                db_router.PrimaryReplicaRouter, 'db_for_read', db_for_read
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, method, path, data=None, openid=None):
+        """发起请求，返回 (响应, 本次请求各读取路由到的连接)"""
+        self.reads.clear()
+        headers = {'Authorization': f'Bearer {openid}'} if openid else {}
+        if method == 'POST':
+            response = self.client.post(
+                path, json.dumps(data), content_type='application/json',
+                headers=headers
+            )
+        else:
+            response = self.client.get(path, data, headers=headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, set(self.reads)
+
+    def test_catalog_reads_use_replica(self):
+        _, reads = self.request('GET', '/api/tags/')
+        self.assertEqual(reads, {'replica'})
+
+    def test_catalog_change_pins_primary(self):
+        bump_catalog_version()
+        _, reads = self.request('GET', '/api/goods/', {'tag_id': self.tag.id})
+        self.assertEqual(reads, {'default'})
+
+    def test_own_write_pins_primary(self):
+        _, reads = self.request(
+            'GET', '/api/orders/', openid=self.buyer.openid
+        )
+        self.assertEqual(reads, {'replica'})
+
+        self.request('POST', '/api/orders/create/', {
+            'goods_id': self.goods.id,
+            'receiver_name': '张三',
+            'receiver_phone': '13800000000',
+            'receiver_address': '地址',
+        }, openid=self.buyer.openid)
+
+        response, reads = self.request(
+            'GET', '/api/orders/', openid=self.buyer.openid
+        )
+        self.assertEqual(reads, {'default'})
+        self.assertEqual(len(json.loads(response.content)['data']), 1)
+
+        # 只钉住写入的用户
+        _, reads = self.request(
+            'GET', '/api/orders/', openid=self.other.openid
+        )
+        self.assertEqual(reads, {'replica'})
+
+    def test_no_replicas_configured(self):
+        with mock.patch.object(db_router, 'DATABASE_REPLICAS', []):
+            _, reads = self.request('GET', '/api/tags/')
+        self.assertEqual(reads, {'default'})
+
+    @override_settings(DEBUG=True)
+    def test_async_middleware_chain(self):
+        # 中间件都支持异步时，ASGI 不会把调用链适配成同步执行（DEBUG 下记录适配）
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_async_catalog_reads_use_replica(self):
+        self.reads.clear()
+        response = await self.async_client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.reads), {'replica'})
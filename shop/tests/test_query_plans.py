@@ -0,0 +1,276 @@
+"""
+在种子数据上对各接口执行的 SQL 做 EXPLAIN，出现全表扫描或文件排序时失败；
+只读接口同时检查每个请求的 SQL 数
+"""
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from shop import payments, views
+from shop.bestsellers import expire_windows
+from shop.cache import bump_catalog_version
+from shop.models import BestSeller, Goods, Order, Tag, WechatUser
+from shop.notifications import process_batch
+from shop.orders import expire_pending_orders, mark_order_paid
+from shop.stock import release_expired_reservations, set_stock
+from shop.tests import TEST_CACHES
+
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+
+def explain_problems(sql, params):
+    """执行 EXPLAIN，返回全表扫描/文件排序等问题列表"""
+    problems = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            for row in cursor.fetchall():
+                detail = row[-1]
+                if detail.startswith('SCAN ') and 'INDEX' not in detail:
+                    problems.append(f'全表扫描: {detail}')
+                if 'TEMP B-TREE FOR ORDER BY' in detail:
+                    problems.append(f'文件排序: {detail}')
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columns = [col[0].lower() for col in cursor.description]
+            for row in cursor.fetchall():
+                plan = dict(zip(columns, row))
+                if plan.get('type') == 'ALL':
+                    problems.append(f"全表扫描: {plan.get('table')}")
+                if 'filesort' in (plan.get('extra') or ''):
+                    problems.append(f"文件排序: {plan.get('table')}")
+        else:
+            raise NotImplementedError(f'不支持的数据库: {connection.vendor}')
+    return problems
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryPlanTests(TestCase):
+    GOODS_COUNT = 1000
+    ORDER_COUNT = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = Tag.objects.bulk_create([
+            Tag(name=f'标签{i}', sequence=i) for i in range(20)
+        ])
+        Goods.objects.bulk_create([
+            Goods(
+                name=f'商品{i}', price=Decimal('9.90'), tag=tags[i % 20],
+                desc='', tags='新品,热卖', is_active=i % 10 != 0
+            )
+            for i in range(cls.GOODS_COUNT)
+        ])
+        cls.goods = list(Goods.objects.filter(is_active=True)[:2])
+        set_stock(cls.goods[0].id, cls.ORDER_COUNT)
+        users = WechatUser.objects.bulk_create([
+            WechatUser(openid=f'plan-check-{i}') for i in range(10)
+        ])
+        Order.objects.bulk_create([
+            Order(
+                order_number=f'PLAN{i:012d}', user=users[i % 10],
+                goods=cls.goods[0], total_amount=Decimal('9.90'),
+                receiver_name='张三', receiver_phone='13800000000',
+                receiver_address='地址', transaction_id=f'PLANTX{i}'
+                if i % 2 else None,
+                status='paid' if i % 2 else 'pending'
+            )
+            for i in range(cls.ORDER_COUNT)
+        ])
+        cls.tag = tags[0]
+        cls.user = users[0]
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {self.user.openid}'}
+        self.receiver = {
+            'receiver_name': '张三',
+            'receiver_phone': '13800000000',
+            'receiver_address': '地址',
+        }
+
+    def assertIndexedQueries(self, name, scenario):
+        """执行 scenario 并对其中的 SQL 做 EXPLAIN"""
+        with CaptureQueriesContext(connection) as context:
+            scenario()
+        captured = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith(EXPLAINED_STATEMENTS)
+        ]
+        with self.subTest(name):
+            self.assertTrue(captured, '没有执行任何查询')
+            problems = [
+                f'{problem}\n    {sql}'
+                for sql in captured for problem in explain_problems(sql, None)
+            ]
+            self.assertEqual(problems, [])
+
+    def get(self, view, path, data=None, **extra):
+        response = view(self.factory.get(path, data, **extra))
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def post(self, view, path, data, content_type='application/json'):
+        if content_type == 'application/json':
+            data = json.dumps(data)
+        response = view(self.factory.post(
+            path, data, content_type=content_type, **self.auth
+        ))
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def notify(self, order_number, transaction_id):
+        params = {
+            'return_code': 'SUCCESS',
+            'result_code': 'SUCCESS',
+            'out_trade_no': order_number,
+            'transaction_id': transaction_id,
+        }
+        body = ''.join(f'<{k}>{v}</{k}>' for k, v in params.items())
+        views.wechat_pay_notify(self.factory.post(
+            '/api/wechat-pay-notify/',
+            f'<xml>{body}<sign>{payments.sign(params)}</sign></xml>',
+            content_type='application/xml'
+        ))
+
+    def test_catalog_plans(self):
+        def get_tags():
+            bump_catalog_version()
+            self.get(views.get_tags, '/api/tags/')
+
+        def get_goods():
+            bump_catalog_version()
+            self.get(views.get_goods, '/api/goods/', {'tag_id': self.tag.id})
+
+        self.assertIndexedQueries('get_tags', get_tags)
+        self.assertIndexedQueries('get_goods', get_goods)
+
+    def test_order_plans(self):
+        state = {}
+
+        def get_orders():
+            state['cursor'] = self.get(
+                views.get_orders, '/api/orders/', **self.auth
+            )['next_cursor']
+
+        def get_orders_next_page():
+            self.get(
+                views.get_orders, '/api/orders/',
+                {'cursor': state['cursor']}, **self.auth
+            )
+
+        def create_order():
+            state['order_number'] = self.post(
+                views.create_order, '/api/orders/create/',
+                {'goods_id': self.goods[0].id, **self.receiver}
+            )['data']['order_number']
+
+        def checkout():
+            self.post(views.checkout, '/api/orders/checkout/', {
+                'items': [
+                    {'goods_id': goods.id, 'quantity': 1}
+                    for goods in self.goods
+                ],
+                **self.receiver
+            })
+
+        self.assertIndexedQueries('get_orders', get_orders)
+        self.assertIndexedQueries('get_orders (cursor)', get_orders_next_page)
+        self.assertIndexedQueries('create_order', create_order)
+        self.assertIndexedQueries('checkout', checkout)
+        self.assertIndexedQueries(
+            'wechat_pay_notify',
+            lambda: self.notify(state['order_number'], 'PLANTX-NOTIFY')
+        )
+        self.assertIndexedQueries('process_payment_notifications', process_batch)
+        self.assertEqual(
+            Order.objects.get(order_number=state['order_number']).status,
+            'paid'
+        )
+
+    def test_background_job_plans(self):
+        later = timezone.now() + timedelta(days=1)
+        # 留下一个已取消但未释放预占的订单，供过期预占清理处理
+        order_number = self.post(
+            views.create_order, '/api/orders/create/',
+            {'goods_id': self.goods[0].id, **self.receiver}
+        )['data']['order_number']
+        Order.objects.filter(order_number=order_number).update(
+            status='cancelled'
+        )
+        self.assertIndexedQueries(
+            'release_expired_reservations',
+            lambda: release_expired_reservations(now=later)
+        )
+        self.assertIndexedQueries(
+            'expire_pending_orders',
+            lambda: expire_pending_orders(now=later, pause=0)
+        )
+
+    def test_best_seller_plans(self):
+        order_number = self.post(
+            views.create_order, '/api/orders/create/',
+            {'goods_id': self.goods[0].id, **self.receiver}
+        )['data']['order_number']
+        mark_order_paid(order_number, 'PLANTX-BEST')
+
+        def get_best_sellers():
+            data = self.get(
+                views.get_best_sellers, '/api/goods/best-sellers/',
+                {'period': '7d'}
+            )['data']
+            self.assertEqual([item['id'] for item in data], [self.goods[0].id])
+            self.get(
+                views.get_best_sellers, '/api/goods/best-sellers/',
+                {'period': '24h', 'tag_id': self.tag.id}
+            )
+
+        def expire_best_sellers():
+            expire_windows()
+            expire_windows(now=timezone.now() + timedelta(days=2))
+
+        self.assertIndexedQueries('get_best_sellers', get_best_sellers)
+        self.assertIndexedQueries('maintain_best_sellers', expire_best_sellers)
+
+    def test_read_query_counts(self):
+        """只读接口每个请求的 SQL 数与数据量无关"""
+        bump_catalog_version()
+        with self.assertNumQueries(2):
+            self.get(views.get_tags, '/api/tags/')
+        with self.assertNumQueries(0):
+            self.get(views.get_tags, '/api/tags/')
+        with self.assertNumQueries(2):
+            self.get(views.get_goods, '/api/goods/', {'tag_id': self.tag.id})
+        with self.assertNumQueries(2):
+            cursor = self.get(
+                views.get_orders, '/api/orders/', **self.auth
+            )['next_cursor']
+        with self.assertNumQueries(2):
+            self.get(
+                views.get_orders, '/api/orders/', {'cursor': cursor},
+                **self.auth
+            )
+        BestSeller.objects.bulk_create([
+            BestSeller(
+                period='7d', goods_id=goods.id, tag_id=goods.tag_id,
+                quantity=10 - i
+            )
+            for i, goods in enumerate(self.goods)
+        ])
+        # 排名一次查询，商品数据一次查询
+        with self.assertNumQueries(2):
+            data = self.get(
+                views.get_best_sellers, '/api/goods/best-sellers/',
+                {'period': '7d'}
+            )['data']
+        self.assertEqual(
+            [item['id'] for item in data], [goods.id for goods in self.goods]
+        )
@@ -0,0 +1,245 @@
+"""
+微信客户端的超时、重试与熔断行为，以及调用微信的异步视图
+（httpx.MockTransport 模拟微信接口）
+"""
+import asyncio
+import time
+from collections import Counter
+from decimal import Decimal
+from unittest import mock
+
+import httpx
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from shop import db_router, metrics, wechat
+from shop.models import Goods, Order, Tag, WechatUser
+from shop.tests import TEST_CACHES
+
+
+XML_ORDER = b'<xml><out_trade_no>CHECK0001</out_trade_no></xml>'
+PREPAY_RESPONSE = (
+    b'<xml><return_code>SUCCESS</return_code>'
+    b'<result_code>SUCCESS</result_code>'
+    b'<prepay_id>wx-test</prepay_id></xml>'
+)
+
+
+class FakeWechat:
+    """按注入的延迟/错误应答的微信接口，记录每个接口的请求次数和所在事件循环"""
+
+    def __init__(self, latency=0.0, fail_next=0, error_rate=0.0,
+                 connect_error=False):
+        self.latency = latency
+        self.fail_next = fail_next
+        self.error_rate = error_rate
+        self.connect_error = connect_error
+        self.hits = Counter()
+        self.loops = set()
+
+    async def __call__(self, request):
+        name = request.url.path.rsplit('/', 1)[-1]
+        self.hits[name] += 1
+        self.loops.add(asyncio.get_running_loop())
+        if self.connect_error:
+            raise httpx.ConnectError('connection refused', request=request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_next:
+            self.fail_next -= 1
+            return httpx.Response(500)
+        if self.error_rate:
+            return httpx.Response(500)
+        if name == 'jscode2session':
+            code = request.url.params['js_code']
+            return httpx.Response(200, json={'openid': f'openid-{code}'})
+        return httpx.Response(200, content=PREPAY_RESPONSE)
+
+
+def use_fake_wechat(test, **injection):
+    """让该测试的微信请求发往 FakeWechat"""
+    fake = FakeWechat(**injection)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    patcher = mock.patch.object(wechat, 'get_client', return_value=client)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    test.addCleanup(lambda: wechat.submit(client.aclose()).result(5))
+    return fake
+
+
+class WechatClientTests(SimpleTestCase):
+
+    def setUp(self):
+        endpoints = {
+            'jscode2session': {
+                'timeout': 0.3, 'retries': 2, 'idempotent': False
+            },
+            'unifiedorder': {
+                'timeout': 0.3, 'retries': 2, 'idempotent': True
+            },
+        }
+        breakers = {
+            name: wechat.CircuitBreaker(
+                name, failure_rate=0.5, min_requests=4, window=10.0,
+                reset_timeout=0.5
+            )
+            for name in endpoints
+        }
+        for patcher in (
+            mock.patch.object(wechat, 'WECHAT_ENDPOINTS', endpoints),
+            mock.patch.object(wechat, 'breakers', breakers),
+            mock.patch.object(wechat, 'retry_delay', return_value=0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake(self, **injection):
+        return use_fake_wechat(self, **injection)
+
+    def login(self, code='code'):
+        return asyncio.run(wechat.jscode2session('appid', 'secret', code))
+
+    def order(self):
+        return asyncio.run(wechat.unifiedorder(XML_ORDER))
+
+    def test_login(self):
+        self.fake()
+        self.assertEqual(self.login('abc'), {'openid': 'openid-abc'})
+
+    def test_requests_run_on_background_loop(self):
+        fake = self.fake()
+        self.login()
+        self.order()
+        self.assertEqual(fake.loops, {wechat.background_loop()})
+
+    def test_client_shared_across_event_loops(self):
+        async def client():
+            return wechat.get_client()
+
+        first = wechat.submit(client()).result(5)
+        second = wechat.submit(client()).result(5)
+        self.assertIs(first, second)
+        self.assertFalse(first.is_closed)
+        asyncio.run(wechat.close_client())
+        self.assertTrue(first.is_closed)
+
+    def test_idempotent_retries_server_errors(self):
+        fake = self.fake(fail_next=2)
+        self.assertIn(b'prepay_id', self.order())
+        self.assertEqual(fake.hits['unifiedorder'], 3)
+
+    def test_non_idempotent_timeout_not_retried(self):
+        fake = self.fake(latency=1.0)
+        started = time.perf_counter()
+        with self.assertRaises(wechat.WechatError):
+            self.login()
+        self.assertEqual(fake.hits['jscode2session'], 1)
+        self.assertLess(time.perf_counter() - started, 0.6)
+
+    def test_connect_errors_retried(self):
+        fake = self.fake(connect_error=True)
+        with self.assertRaises(wechat.WechatError):
+            self.login()
+        self.assertEqual(fake.hits['jscode2session'], 3)
+
+    def test_breaker_opens_and_recovers(self):
+        fake = self.fake(error_rate=1.0)
+        for _ in range(2):
+            with self.assertRaises(wechat.WechatError):
+                self.order()
+        breaker = wechat.breakers['unifiedorder']
+        self.assertEqual(breaker.snapshot()['state'], 'open')
+
+        # 打开后快速失败，不再访问上游
+        hits = fake.hits['unifiedorder']
+        started = time.perf_counter()
+        with self.assertRaises(wechat.CircuitOpenError):
+            self.order()
+        self.assertLess(time.perf_counter() - started, 0.05)
+        self.assertEqual(fake.hits['unifiedorder'], hits)
+
+        # 冷却后放行探测请求，上游恢复则关闭
+        fake.error_rate = 0.0
+        time.sleep(0.6)
+        self.assertIn(b'prepay_id', self.order())
+        self.assertEqual(breaker.snapshot()['state'], 'closed')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WechatStatusTests(SimpleTestCase):
+
+    def test_requires_metrics_token(self):
+        with mock.patch.object(metrics, 'METRICS_TOKEN', 'secret'):
+            self.assertEqual(
+                self.client.get('/api/wechat-status/').status_code, 401
+            )
+            response = self.client.get(
+                '/api/wechat-status/',
+                headers={'Authorization': 'Bearer secret'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item['name'] for item in response.json()['data']},
+            set(wechat.breakers)
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WechatViewTests(TestCase):
+    """通过 Django 测试客户端调用异步的登录和支付视图"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = WechatUser.objects.create(openid='view-buyer')
+        goods = Goods.objects.create(
+            name='苹果', price=Decimal('3.50'),
+            tag=Tag.objects.create(name='水果'), desc=''
+        )
+        cls.order = Order.objects.create(
+            user=cls.user, goods=goods, total_amount=Decimal('3.50'),
+            receiver_name='张三', receiver_phone='13800000000',
+            receiver_address='地址'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.fake = use_fake_wechat(self)
+        patcher = mock.patch.object(
+            db_router, 'DATABASE_REPLICAS', ['replica']
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_login_creates_user_and_pins_primary(self):
+        response = await self.async_client.post(
+            '/api/wechat-login/', {'code': 'abc'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['data'], {
+            'openid': 'openid-abc', 'is_new_user': True
+        })
+        self.assertTrue(
+            await WechatUser.objects.filter(openid='openid-abc').aexists()
+        )
+        self.assertTrue(
+            db_router.is_pinned(db_router.user_scope('openid-abc'))
+        )
+        self.assertEqual(self.fake.hits['jscode2session'], 1)
+
+    async def test_pay_returns_signed_params(self):
+        response = await self.async_client.post(
+            '/api/wechat-pay/', {'order_id': self.order.id},
+            content_type='application/json',
+            headers={'Authorization': f'Bearer {self.user.openid}'}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            response.json()['data']['package'], 'prepay_id=wx-test'
+        )
+        order = await Order.objects.aget(id=self.order.id)
+        self.assertEqual(order.prepay_id, 'wx-test')
+        # 写入订单后钉住该用户
+        self.assertTrue(db_router.is_pinned(
+            db_router.user_scope(self.user.openid)
+        ))
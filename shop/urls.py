@@ -6,13 +6,27 @@ urlpatterns = [
     # 用户认证
     path('api/wechat-login/', views.wechat_login, name='wechat_login'),
     path('api/current-user/', views.get_current_user, name='get_current_user'),
+    path('api/wechat-status/', views.wechat_status, name='wechat_status'),
+    path('api/metrics/', views.get_metrics, name='metrics'),
 
     # 商品相关
     path('api/tags/', views.get_tags, name='get_tags'),
     path('api/goods/', views.get_goods, name='get_goods'),
+    path('api/goods/search/', views.search_goods, name='search_goods'),
+    path(
+        'api/goods/best-sellers/',
+        views.get_best_sellers,
+        name='get_best_sellers'
+    ),
+    path(
+        'api/goods/images/<str:name>',
+        views.goods_image,
+        name='goods_image'
+    ),
 
     # 订单相关
     path('api/orders/create/', views.create_order, name='create_order'),
+    path('api/orders/checkout/', views.checkout, name='checkout'),
     path('api/orders/', views.get_orders, name='get_orders'),
 
     # 支付相关
@@ -1,19 +1,80 @@
-from django.forms import model_to_dict
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponse
-from django.utils import timezone
+from django.http import FileResponse, JsonResponse, HttpResponse
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max, Q
+from django.utils.crypto import constant_time_compare
 import json
-import requests
 from shop.models import Tag, WechatUser, Goods, Order
-import time
-import hashlib
+from shop import images, metrics, payments, wechat
+from shop.bestsellers import (
+    BEST_SELLER_WINDOWS, BEST_SELLERS_MAX_LIMIT, best_sellers
+)
+from shop.cache import cached_json_response, catalog_condition
+from shop.db_router import (
+    CATALOG_SCOPE, apin_primary, replica_reads, request_scope, user_scope
+)
+from shop.notifications import enqueue_notification
+from shop.orders import CartError, parse_cart_items, place_order
+from shop.search import goods_index
+from shop.serializers import (
+    ORDER_PROJECTOR, TAG_PROJECTOR, goods_rows, json_response
+)
+from shop.pagination import (
+    InvalidCursor, paginate_by_cursor, parse_page_size
+)
 import xml.etree.ElementTree as ET
-import random
-from django.conf import settings
+from operator import itemgetter
+
+# 订单列表游标取值：(created_at, id)
+ORDER_CURSOR_KEY = itemgetter(
+    ORDER_PROJECTOR.index('created_at'), ORDER_PROJECTOR.index('id')
+)
+
+
+def wechat_unavailable(error):
+    """微信接口熔断期间快速失败"""
+    response = JsonResponse({
+        'code': 503,
+        'message': '微信服务暂时不可用，请稍后重试'
+    }, status=503)
+    response['Retry-After'] = str(max(1, int(error.retry_after + 0.5)))
+    return response
+
+
+def monitoring_unauthorized(request):
+    """监控接口的令牌校验（METRICS_TOKEN），未通过时返回 401 响应"""
+    if metrics.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get('Authorization', ''),
+            f'Bearer {metrics.METRICS_TOKEN}'):
+        return JsonResponse({
+            'code': 401,
+            'message': '未授权'
+        }, status=401)
+    return None
+
+
+def get_metrics(request):
+    """Prometheus 指标抓取接口"""
+    denied = monitoring_unauthorized(request)
+    if denied:
+        return denied
+    content, content_type = metrics.render()
+    return HttpResponse(content, content_type=content_type)
+
+
+def wechat_status(request):
+    """微信接口熔断器状态（与指标接口使用相同的访问令牌）"""
+    denied = monitoring_unauthorized(request)
+    if denied:
+        return denied
+    return JsonResponse({
+        'code': 200,
+        'data': wechat.breaker_states()
+    })
 
 
 @csrf_exempt
-def wechat_login(request):
+async def wechat_login(request):
     """
     微信小程序登录接口
     接收小程序传来的code，调用微信API获取openid和session_key
@@ -34,13 +95,7 @@ def wechat_login(request):
             secret = '3d3719b287f359b54e8d310fb9e7fcb5'  # 替换为你的小程序AppSecret
 
             # 调用微信API获取openid和session_key
-            wechat_api_url = (
-                f'https://api.weixin.qq.com/sns/jscode2session?'
-                f'appid={appid}&secret={secret}&js_code={code}&grant_type=authorization_code'
-            )
-
-            response = requests.get(wechat_api_url)
-            wechat_data = response.json()
+            wechat_data = await wechat.jscode2session(appid, secret, code)
 
             if 'openid' not in wechat_data:
                 return JsonResponse({
@@ -53,7 +108,7 @@ def wechat_login(request):
             session_key = wechat_data.get('session_key', '')
 
             # 查找或创建用户
-            user, created = WechatUser.objects.get_or_create(
+            user, created = await WechatUser.objects.aget_or_create(
                 openid=openid,
                 defaults={
                     'session_key': session_key
@@ -63,7 +118,9 @@ def wechat_login(request):
             if not created:
                 if session_key:
                     user.session_key = session_key
-                user.save()
+                await user.asave()
+            # 新用户在副本同步前读取主库（异步缓存调用，不阻塞事件循环）
+            await apin_primary(user_scope(openid))
 
             return JsonResponse({
                 'code': 200,
@@ -79,6 +136,14 @@ def wechat_login(request):
                 'code': 400,
                 'message': '请求数据格式错误'
             }, status=400)
+        except wechat.CircuitOpenError as e:
+            return wechat_unavailable(e)
+        except wechat.WechatError as e:
+            return JsonResponse({
+                'code': 502,
+                'message': '微信服务请求失败',
+                'error': str(e)
+            }, status=502)
         except Exception as e:
             return JsonResponse({
                 'code': 500,
@@ -130,42 +195,131 @@ def get_current_user(request):
     }, status=405)
 
 
+def _build_tags():
+    tags = Tag.objects.filter(is_active=True).order_by('sequence')
+    return {
+        'code': 200,
+        'data': TAG_PROJECTOR.rows(tags)
+    }
+
+
+def _tag_validators():
+    # 包含未激活标签：停用/删除标签也会改变校验值
+    return Tag.objects.aggregate(
+        count=Count('id', filter=Q(is_active=True)),
+        last_modified=Max('updated_at'),
+    )
+
+
 @csrf_exempt
+@replica_reads(lambda request: (CATALOG_SCOPE,))
+@catalog_condition('tags', _tag_validators)
 def get_tags(request):
-    tags = Tag.objects.filter(is_active=True).order_by('sequence').all()
-    return JsonResponse({
+    return cached_json_response('tags', _build_tags)
+
+
+def _build_goods(tag_id):
+    goods = Goods.objects.filter(
+        is_active=True, tag_id=tag_id).order_by('id')
+    return {
         'code': 200,
-        'data': [model_to_dict(tag) for tag in tags]
-    })
+        'data': goods_rows(goods)
+    }
+
+
+def _goods_validators(tag_id):
+    return Goods.objects.filter(tag_id=tag_id).aggregate(
+        count=Count('id', filter=Q(is_active=True)),
+        last_modified=Max('updated_at'),
+    )
 
 
 @csrf_exempt
+@replica_reads(lambda request: (CATALOG_SCOPE,))
+@catalog_condition(
+    'goods', _goods_validators,
+    lambda request: (request.GET.get('tag_id'),)
+)
 def get_goods(request):
     tag_id = request.GET.get('tag_id')
-    goods = Goods.objects.filter(
-        is_active=True, tag_id=tag_id).order_by('id').all()
-    ret = []
-    for good in goods:
-        tag_list = []
-        tags = good.tags.split(',') if good.tags else []
-        for tag in tags:
-            tag_list.append({
-                "text": tag,
-                "theme": "primary",
-            })
-        data = model_to_dict(good, exclude=['url'])
-        data['tags'] = tag_list
-        if good.url:
-            data['url'] = f"{settings.SITE_DOMAIN}{good.url.url}"
-        else:
-            data['url'] = None
-        ret.append(data)
-    return JsonResponse({
+    return cached_json_response(
+        'goods', lambda: _build_goods(tag_id), tag_id)
+
+
+@csrf_exempt
+def search_goods(request):
+    """商品搜索接口"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({
+            'code': 400,
+            'message': '缺少必要参数: q'
+        }, status=400)
+    try:
+        tag_id = request.GET.get('tag_id')
+        tag_id = int(tag_id) if tag_id else None
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 50)
+    except ValueError:
+        return JsonResponse({
+            'code': 400,
+            'message': '参数格式错误'
+        }, status=400)
+    return json_response({
         'code': 200,
-        'data': ret
+        'data': goods_index.search(query, tag_id=tag_id, limit=limit)
     })
 
 
+@csrf_exempt
+@replica_reads(lambda request: (CATALOG_SCOPE,))
+def get_best_sellers(request):
+    """热销榜接口：period 为 24h/7d/30d，可按 tag_id 筛选"""
+    period = request.GET.get('period', '24h')
+    if period not in BEST_SELLER_WINDOWS:
+        return JsonResponse({
+            'code': 400,
+            'message': f"period 可选值: {', '.join(BEST_SELLER_WINDOWS)}"
+        }, status=400)
+    try:
+        tag_id = request.GET.get('tag_id')
+        tag_id = int(tag_id) if tag_id else None
+        limit = min(
+            max(int(request.GET.get('limit', 20)), 1), BEST_SELLERS_MAX_LIMIT
+        )
+    except ValueError:
+        return JsonResponse({
+            'code': 400,
+            'message': '参数格式错误'
+        }, status=400)
+    return json_response({
+        'code': 200,
+        'data': best_sellers(period, tag_id=tag_id, limit=limit)
+    })
+
+
+def goods_image(request, name):
+    """
+    商品衍生图
+    文件名为内容哈希，内容永不改变，可被客户端和 CDN 长期缓存
+    （也可由 Nginx 直接映射 MEDIA_ROOT/derivatives 并设置相同的缓存头）
+    """
+    match = images.DERIVATIVE_NAME_RE.match(name)
+    path = f'{images.DERIVATIVE_DIR}/{name}'
+    if not match or not default_storage.exists(path):
+        return JsonResponse({
+            'code': 404,
+            'message': '图片不存在'
+        }, status=404)
+    response = FileResponse(
+        default_storage.open(path, 'rb'),
+        content_type=images.CONTENT_TYPES[match.group(1)]
+    )
+    response['Cache-Control'] = (
+        f'public, max-age={images.GOODS_IMAGE_CACHE_MAX_AGE}, immutable'
+    )
+    return response
+
+
 def get_user_from_session(request):
     """从session获取用户"""
     openid = request.META.get('HTTP_AUTHORIZATION').replace('Bearer ', '')
@@ -177,6 +331,14 @@ def get_user_from_session(request):
         return None
 
 
+async def aget_user_from_session(request):
+    """从session获取用户（异步视图使用）"""
+    openid = request.META.get('HTTP_AUTHORIZATION').replace('Bearer ', '')
+    if not openid:
+        return None
+    return await WechatUser.objects.filter(openid=openid).afirst()
+
+
 @csrf_exempt
 def create_order(request):
     """创建订单接口"""
@@ -204,25 +366,27 @@ def create_order(request):
                     'message': '缺少必要参数'
                 }, status=400)
 
-            # 获取商品信息
+            # 创建订单
             try:
-                goods = Goods.objects.get(id=goods_id, is_active=True)
-            except Goods.DoesNotExist:
+                order, _ = place_order(
+                    user,
+                    parse_cart_items([
+                        {'goods_id': goods_id, 'quantity': quantity}
+                    ]),
+                    receiver_name,
+                    receiver_phone,
+                    receiver_address
+                )
+            except CartError as e:
                 return JsonResponse({
-                    'code': 404,
-                    'message': '商品不存在'
-                }, status=404)
+                    'code': e.status,
+                    'message': e.message
+                }, status=e.status)
 
-            # 创建订单
-            order = Order(
-                user=user,
-                goods=goods,
-                quantity=quantity,
-                receiver_name=receiver_name,
-                receiver_phone=receiver_phone,
-                receiver_address=receiver_address
+            # 后台预先统一下单，用户点击支付时直接复用
+            payments.schedule_prepay(
+                order, request.META.get('REMOTE_ADDR', '127.0.0.1')
             )
-            order.save()
 
             return JsonResponse({
                 'code': 200,
@@ -253,9 +417,9 @@ def create_order(request):
 
 
 @csrf_exempt
-def get_orders(request):
-    """获取用户订单列表"""
-    if request.method == 'GET':
+def checkout(request):
+    """购物车结算接口（多商品下单）"""
+    if request.method == 'POST':
         try:
             user = get_user_from_session(request)
             if not user:
@@ -264,28 +428,107 @@ def get_orders(request):
                     'message': '用户未登录'
                 }, status=401)
 
-            orders = Order.objects.filter(
-                user=user
-            ).order_by('-created_at')
+            data = json.loads(request.body)
+            receiver_name = data.get('receiver_name')
+            receiver_phone = data.get('receiver_phone')
+            receiver_address = data.get('receiver_address')
+
+            # 验证必填字段
+            if not all([receiver_name, receiver_phone, receiver_address]):
+                return JsonResponse({
+                    'code': 400,
+                    'message': '缺少必要参数'
+                }, status=400)
 
-            orders_data = []
-            for order in orders:
-                orders_data.append({
-                    'id': order.id,
+            try:
+                order, items = place_order(
+                    user,
+                    parse_cart_items(data.get('items')),
+                    receiver_name,
+                    receiver_phone,
+                    receiver_address
+                )
+            except CartError as e:
+                return JsonResponse({
+                    'code': e.status,
+                    'message': e.message
+                }, status=e.status)
+
+            # 后台预先统一下单，用户点击支付时直接复用
+            payments.schedule_prepay(
+                order, request.META.get('REMOTE_ADDR', '127.0.0.1')
+            )
+
+            return JsonResponse({
+                'code': 200,
+                'message': '订单创建成功',
+                'data': {
+                    'order_id': order.id,
                     'order_number': order.order_number,
-                    'goods_name': order.goods.name,
-                    'quantity': order.quantity,
                     'total_amount': float(order.total_amount),
-                    'status': order.status,
-                    'status_display': order.get_status_display(),
-                    'created_at': order.created_at.isoformat(),
-                    'paid_at': order.paid_at.isoformat() if order.paid_at else None
-                })
+                    'items': [{
+                        'goods_id': item.goods_id,
+                        'goods_name': item.goods.name,
+                        'quantity': item.quantity,
+                        'price': float(item.price),
+                        'total_amount': float(item.total_amount)
+                    } for item in items]
+                }
+            })
 
+        except json.JSONDecodeError:
             return JsonResponse({
+                'code': 400,
+                'message': '请求数据格式错误'
+            }, status=400)
+        except Exception as e:
+            return JsonResponse({
+                'code': 500,
+                'message': '服务器内部错误',
+                'error': str(e)
+            }, status=500)
+
+    return JsonResponse({
+        'code': 405,
+        'message': '方法不允许'
+    }, status=405)
+
+
+@csrf_exempt
+@replica_reads(lambda request: (request_scope(request),))
+def get_orders(request):
+    """获取用户订单列表"""
+    if request.method == 'GET':
+        try:
+            user = get_user_from_session(request)
+            if not user:
+                return JsonResponse({
+                    'code': 401,
+                    'message': '用户未登录'
+                }, status=401)
+
+            page_size = parse_page_size(request.GET.get('page_size'))
+            try:
+                orders, next_cursor, has_more = paginate_by_cursor(
+                    ORDER_PROJECTOR.values(Order.objects.filter(user=user)),
+                    cursor=request.GET.get('cursor'),
+                    page_size=page_size,
+                    cursor_key=ORDER_CURSOR_KEY
+                )
+            except InvalidCursor:
+                return JsonResponse({
+                    'code': 400,
+                    'message': '分页游标无效'
+                }, status=400)
+
+            orders_data = [ORDER_PROJECTOR.project(row) for row in orders]
+
+            return json_response({
                 'code': 200,
                 'message': '获取订单列表成功',
-                'data': orders_data
+                'data': orders_data,
+                'next_cursor': next_cursor,
+                'has_more': has_more
             })
 
         except Exception as e:
@@ -302,11 +545,11 @@ def get_orders(request):
 
 
 @csrf_exempt
-def wechat_pay(request):
+async def wechat_pay(request):
     """微信支付接口"""
     if request.method == 'POST':
         try:
-            user = get_user_from_session(request)
+            user = await aget_user_from_session(request)
             if not user:
                 return JsonResponse({
                     'code': 401,
@@ -324,7 +567,7 @@ def wechat_pay(request):
 
             # 获取订单
             try:
-                order = Order.objects.get(
+                order = await Order.objects.select_related('goods').aget(
                     id=order_id,
                     user=user,
                     status='pending'
@@ -335,123 +578,38 @@ def wechat_pay(request):
                     'message': '订单不存在或状态不正确'
                 }, status=404)
 
-            # 微信支付配置（实际项目中应从环境变量获取）
-            appid = 'YOUR_WECHAT_APPID'
-            mch_id = 'YOUR_MCH_ID'
-            api_key = 'YOUR_API_KEY'
-
-            # 生成预支付订单
-            nonce_str = ''.join(
-                random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=32)
-            )
-            body = f"商品购买 - {order.goods.name}"
-            out_trade_no = order.order_number
-            total_fee = int(order.total_amount * 100)  # 转换为分
-            spbill_create_ip = request.META.get('REMOTE_ADDR', '127.0.0.1')
-            notify_url = 'http://your-domain.com/shop/wechat_pay_notify/'
-            trade_type = 'JSAPI'
-            openid = user.openid
-
-            # 生成签名
-            params = {
-                'appid': appid,
-                'mch_id': mch_id,
-                'nonce_str': nonce_str,
-                'body': body,
-                'out_trade_no': out_trade_no,
-                'total_fee': total_fee,
-                'spbill_create_ip': spbill_create_ip,
-                'notify_url': notify_url,
-                'trade_type': trade_type,
-                'openid': openid
-            }
-
-            # 按参数名ASCII码从小到大排序
-            sorted_params = sorted(params.items())
-            sign_str = '&'.join([f"{k}={v}" for k, v in sorted_params])
-            sign_str += f"&key={api_key}"
-            sign = hashlib.md5(sign_str.encode('utf-8')).hexdigest().upper()
-
-            # 构建XML请求数据
-            xml_data = f"""<xml>
-<appid>{appid}</appid>
-<mch_id>{mch_id}</mch_id>
-<nonce_str>{nonce_str}</nonce_str>
-<body>{body}</body>
-<out_trade_no>{out_trade_no}</out_trade_no>
-<total_fee>{total_fee}</total_fee>
-<spbill_create_ip>{spbill_create_ip}</spbill_create_ip>
-<notify_url>{notify_url}</notify_url>
-<trade_type>{trade_type}</trade_type>
-<openid>{openid}</openid>
-<sign>{sign}</sign>
-</xml>"""
-
-            # 调用微信支付统一下单API
-            wechat_pay_url = 'https://api.mch.weixin.qq.com/pay/unifiedorder'
-            response = requests.post(
-                wechat_pay_url, data=xml_data.encode('utf-8'))
-
-            # 解析响应
-            root = ET.fromstring(response.content)
-            return_code = root.find('return_code').text
-            result_code = root.find('result_code').text
-
-            if return_code == 'SUCCESS' and result_code == 'SUCCESS':
-                prepay_id = root.find('prepay_id').text
-
-                # 保存预支付ID到订单
-                order.prepay_id = prepay_id
-                order.save()
-
-                # 生成前端支付参数
-                timestamp = str(int(time.time()))
-                package = f"prepay_id={prepay_id}"
-                nonce_str = ''.join(
-                    random.choices(
-                        'abcdefghijklmnopqrstuvwxyz0123456789', k=32)
+            # 有效期内复用 prepay_id（下单后通常已在后台预先生成），
+            # 只需重新生成前端签名
+            try:
+                prepay_id = await payments.ensure_prepay(
+                    order, order.goods.name, user.openid,
+                    request.META.get('REMOTE_ADDR', '127.0.0.1')
                 )
-
-                # 生成支付签名
-                pay_params = {
-                    'appId': appid,
-                    'timeStamp': timestamp,
-                    'nonceStr': nonce_str,
-                    'package': package,
-                    'signType': 'MD5'
-                }
-                sorted_pay_params = sorted(pay_params.items())
-                pay_sign_str = '&'.join(
-                    [f"{k}={v}" for k, v in sorted_pay_params])
-                pay_sign_str += f"&key={api_key}"
-                pay_sign = hashlib.md5(
-                    pay_sign_str.encode('utf-8')
-                ).hexdigest().upper()
-
-                return JsonResponse({
-                    'code': 200,
-                    'message': '支付参数生成成功',
-                    'data': {
-                        'appId': appid,
-                        'timeStamp': timestamp,
-                        'nonceStr': nonce_str,
-                        'package': package,
-                        'signType': 'MD5',
-                        'paySign': pay_sign
-                    }
-                })
-            else:
-                error_msg = root.find('return_msg').text
+            except payments.PaymentError as e:
                 return JsonResponse({
                     'code': 400,
-                    'message': f'微信支付下单失败: {error_msg}'
+                    'message': f'微信支付下单失败: {e}'
                 }, status=400)
 
+            return JsonResponse({
+                'code': 200,
+                'message': '支付参数生成成功',
+                'data': payments.pay_params(prepay_id)
+            })
+
         except json.JSONDecodeError:
             return JsonResponse({
                 'code': 400,
                 'message': '请求数据格式错误'
             }, status=400)
+        except wechat.CircuitOpenError as e:
+            return wechat_unavailable(e)
+        except wechat.WechatError as e:
+            return JsonResponse({
+                'code': 502,
+                'message': '微信服务请求失败',
+                'error': str(e)
+            }, status=502)
         except Exception as e:
             return JsonResponse({
                 'code': 500,
@@ -480,14 +638,7 @@ def wechat_pay_notify(request):
                 if child.tag != 'sign':
                     params[child.tag] = child.text
 
-            # 按参数名ASCII码从小到大排序
-            sorted_params = sorted(params.items())
-            sign_str = '&'.join([f"{k}={v}" for k, v in sorted_params])
-            sign_str += f"&key=YOUR_API_KEY"  # 使用你的API密钥
-
-            calculated_sign = hashlib.md5(
-                sign_str.encode('utf-8')
-            ).hexdigest().upper()
+            calculated_sign = payments.sign(params)
 
             received_sign = root.find('sign').text
 
@@ -504,27 +655,20 @@ def wechat_pay_notify(request):
             transaction_id = root.find('transaction_id').text
 
             if return_code == 'SUCCESS' and result_code == 'SUCCESS':
-                # 更新订单状态
-                try:
-                    order = Order.objects.get(order_number=out_trade_no)
-                    order.status = 'paid'
-                    order.transaction_id = transaction_id
-                    order.paid_at = timezone.now()
-                    order.save()
-
-                    # 返回成功响应
-                    response_xml = """<xml>
+                # 写入回调队列后立即应答，订单状态由后台 worker 更新；
+                # 已处理过的交易号直接应答，不产生写入
+                if not Order.objects.filter(
+                        transaction_id=transaction_id).exists():
+                    enqueue_notification(
+                        out_trade_no, transaction_id, xml_data
+                    )
+
+                # 返回成功响应
+                response_xml = """<xml>
 <return_code><![CDATA[SUCCESS]]></return_code>
 <return_msg><![CDATA[OK]]></return_msg>
 </xml>"""
-                    return HttpResponse(response_xml, content_type='application/xml')
-
-                except Order.DoesNotExist:
-                    response_xml = """<xml>
-<return_code><![CDATA[FAIL]]></return_code>
-<return_msg><![CDATA[订单不存在]]></return_msg>
-</xml>"""
-                    return HttpResponse(response_xml, content_type='application/xml')
+                return HttpResponse(response_xml, content_type='application/xml')
 
             else:
                 response_xml = """<xml>
@@ -0,0 +1,344 @@
+"""
+微信接口客户端
+
+每个接口有独立的超时与重试策略：连接阶段失败（请求未发出）总是可以重试，
+请求已发出后的超时/5xx 只对幂等接口重试，重试间隔为带全抖动的指数退避。
+每个接口一个熔断器：滑动窗口内失败率过高时打开，直接快速失败，
+冷却后放行一个探测请求，成功则恢复。
+请求统一在后台线程的常驻事件循环上发出，整个进程共用一个连接池。
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from django.conf import settings
+
+from shop.metrics import observe_outbound
+
+
+WECHAT_API_BASE = getattr(
+    settings, 'WECHAT_API_BASE', 'https://api.weixin.qq.com'
+)
+WECHAT_PAY_API_BASE = getattr(
+    settings, 'WECHAT_PAY_API_BASE', 'https://api.mch.weixin.qq.com'
+)
+
+# 连接池与超时配置（秒）
+WECHAT_HTTP_TIMEOUT = getattr(settings, 'WECHAT_HTTP_TIMEOUT', {
+    'connect': 2.0,
+    'read': 5.0,
+    'write': 5.0,
+    'pool': 3.0,
+})
+WECHAT_HTTP_MAX_CONNECTIONS = getattr(
+    settings, 'WECHAT_HTTP_MAX_CONNECTIONS', 100
+)
+WECHAT_HTTP_MAX_KEEPALIVE = getattr(settings, 'WECHAT_HTTP_MAX_KEEPALIVE', 20)
+
+# 各接口策略：单次请求总超时（秒）、最大重试次数、是否幂等
+# 登录 code 只能使用一次，请求发出后不再重试；统一下单以相同报文重试是安全的
+WECHAT_ENDPOINTS = getattr(settings, 'WECHAT_ENDPOINTS', {
+    'jscode2session': {'timeout': 3.0, 'retries': 2, 'idempotent': False},
+    'unifiedorder': {'timeout': 5.0, 'retries': 2, 'idempotent': True},
+})
+WECHAT_RETRY_BACKOFF = getattr(settings, 'WECHAT_RETRY_BACKOFF', 0.2)
+WECHAT_RETRY_MAX_BACKOFF = getattr(settings, 'WECHAT_RETRY_MAX_BACKOFF', 2.0)
+
+# 熔断器：窗口（秒）内请求数达到 min_requests 且失败率不低于 failure_rate 时打开，
+# 打开 reset_timeout 秒后放行探测请求
+WECHAT_CIRCUIT_BREAKER = getattr(settings, 'WECHAT_CIRCUIT_BREAKER', {
+    'failure_rate': 0.5,
+    'min_requests': 10,
+    'window': 30.0,
+    'reset_timeout': 30.0,
+})
+
+# 请求未发出即失败的异常，任何接口都可以安全重试
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class WechatError(Exception):
+    """微信接口调用失败（重试耗尽）"""
+
+
+class CircuitOpenError(WechatError):
+    """熔断器打开，未发起请求直接失败"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'微信接口 {name} 熔断中')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """失败率熔断器（进程内共享，线程安全）"""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, min_requests=10, window=30.0,
+                 reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._results = deque()
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._results and self._results[0][0] < now - self.window:
+            self._results.popleft()
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self._probing = False
+
+    def allow(self):
+        """是否放行请求；不放行时抛出 CircuitOpenError"""
+        with self._lock:
+            now = self.clock()
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                # 半开状态同一时间只放行一个探测请求
+                if self._probing:
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._probing = True
+
+    def record(self, success):
+        """记录一次请求结果"""
+        with self._lock:
+            now = self.clock()
+            if self.state == self.HALF_OPEN:
+                if success:
+                    self.state = self.CLOSED
+                    self._results.clear()
+                    self._probing = False
+                else:
+                    self._open(now)
+                return
+            self._results.append((now, success))
+            self._trim(now)
+            total = len(self._results)
+            if self.state == self.CLOSED and total >= self.min_requests:
+                failures = sum(1 for _, ok in self._results if not ok)
+                if failures / total >= self.failure_rate:
+                    self._open(now)
+
+    def release(self):
+        """请求被取消、没有结果时释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self):
+        """当前状态，供监控接口展示"""
+        with self._lock:
+            now = self.clock()
+            self._trim(now)
+            total = len(self._results)
+            failures = sum(1 for _, ok in self._results if not ok)
+            retry_after = None
+            if self.state == self.OPEN:
+                retry_after = max(
+                    0.0, self.opened_at + self.reset_timeout - now
+                )
+            return {
+                'name': self.name,
+                'state': self.state,
+                'requests': total,
+                'failures': failures,
+                'retry_after': retry_after,
+            }
+
+
+breakers = {
+    name: CircuitBreaker(name, **WECHAT_CIRCUIT_BREAKER)
+    for name in WECHAT_ENDPOINTS
+}
+
+
+def breaker_states():
+    """各接口熔断器状态"""
+    return [breaker.snapshot() for breaker in breakers.values()]
+
+
+def retry_delay(attempt):
+    """第 attempt 次重试前的等待时间（秒），全抖动指数退避"""
+    return random.uniform(0, min(
+        WECHAT_RETRY_BACKOFF * 2 ** attempt, WECHAT_RETRY_MAX_BACKOFF
+    ))
+
+
+# 所有微信请求都在独立线程中的常驻事件循环上执行，整个进程共用一个客户端
+# （连接池）；WSGI 下每个请求的临时事件循环不再各自创建从不关闭的客户端
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+
+
+def background_loop():
+    """微信请求使用的常驻事件循环（首次使用时在后台线程中启动）"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name='wechat', daemon=True
+            ).start()
+    return _loop
+
+
+def _reset_loop():
+    # fork 后子进程中没有事件循环线程，首次使用时重新创建
+    global _loop, _loop_lock, _client
+    _loop = None
+    _loop_lock = threading.Lock()
+    _client = None
+
+
+os.register_at_fork(after_in_child=_reset_loop)
+
+
+def submit(coro):
+    """在常驻事件循环中执行协程，返回 concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, background_loop())
+
+
+def get_client():
+    """获取进程共享的微信 HTTP 客户端（长连接池），只在常驻事件循环中使用"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(**WECHAT_HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=WECHAT_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=WECHAT_HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def _close_client():
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
+
+
+async def close_client():
+    """关闭共享客户端，下次请求时重新创建"""
+    await _run(_close_client())
+
+
+def shutdown(timeout=10.0):
+    """
+    等待常驻事件循环中未完成的任务（如后台预下单）并关闭客户端，
+    在进程退出前调用（如 gunicorn 的 worker_exit 钩子）
+    """
+    if _loop is None:
+        return
+
+    async def finish():
+        pending = asyncio.all_tasks() - {asyncio.current_task()}
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        await _close_client()
+
+    submit(finish()).result()
+
+
+async def _run(coro):
+    # 已在常驻事件循环中（如后台预下单）时直接执行
+    if asyncio.get_running_loop() is background_loop():
+        return await coro
+    return await asyncio.wrap_future(submit(coro))
+
+
+async def call(name, send):
+    """
+    按接口策略在常驻事件循环中发起请求
+    send(client) 发出请求并返回 httpx.Response；
+    重试耗尽抛出 WechatError，熔断时抛出 CircuitOpenError
+    """
+    return await _run(_call(name, send))
+
+
+async def _call(name, send):
+    policy = WECHAT_ENDPOINTS[name]
+    breaker = breakers[name]
+    attempts = policy['retries'] + 1
+    for attempt in range(attempts):
+        try:
+            breaker.allow()
+        except CircuitOpenError:
+            observe_outbound('wechat', name, 'circuit_open')
+            raise
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(policy['timeout']):
+                response = await send(get_client())
+        except _NOT_SENT_ERRORS as e:
+            error, retryable = e, True
+            outcome = 'connect_error'
+        except (httpx.TransportError, TimeoutError) as e:
+            error, retryable = e, policy['idempotent']
+            outcome = 'timeout' if isinstance(
+                e, (httpx.TimeoutException, TimeoutError)
+            ) else 'error'
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            outcome = f'{response.status_code // 100}xx'
+            if response.status_code < 500:
+                observe_outbound(
+                    'wechat', name, outcome, time.perf_counter() - started
+                )
+                breaker.record(True)
+                return response
+            error = f'HTTP {response.status_code}'
+            retryable = policy['idempotent']
+
+        observe_outbound(
+            'wechat', name, outcome, time.perf_counter() - started
+        )
+        breaker.record(False)
+        if not retryable or attempt == attempts - 1:
+            raise WechatError(f'微信接口 {name} 请求失败: {error!r}')
+        await asyncio.sleep(retry_delay(attempt))
+
+
+async def jscode2session(appid, secret, code):
+    """调用微信登录凭证校验接口，返回 JSON 数据"""
+    response = await call('jscode2session', lambda client: client.get(
+        f'{WECHAT_API_BASE}/sns/jscode2session',
+        params={
+            'appid': appid,
+            'secret': secret,
+            'js_code': code,
+            'grant_type': 'authorization_code',
+        },
+    ))
+    return response.json()
+
+
+async def unifiedorder(xml_data):
+    """调用微信支付统一下单接口，返回响应原始内容"""
+    response = await call('unifiedorder', lambda client: client.post(
+        f'{WECHAT_PAY_API_BASE}/pay/unifiedorder',
+        content=xml_data,
+        headers={'Content-Type': 'application/xml'},
+    ))
+    return response.content
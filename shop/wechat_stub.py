@@ -0,0 +1,129 @@
+"""
+微信接口本地桩服务
+
+模拟登录凭证校验与统一下单接口，可注入延迟与错误，
+用于客户端容错检查和压测（把 WECHAT_API_BASE/WECHAT_PAY_API_BASE 指向桩服务）。
+"""
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+_OUT_TRADE_NO_RE = re.compile(rb'<out_trade_no>([^<]*)</out_trade_no>')
+
+
+class WechatStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject(self, endpoint):
+        """记录调用并按配置注入延迟/错误，返回是否已应答错误"""
+        server = self.server
+        server.record(endpoint)
+        if server.latency:
+            time.sleep(server.latency)
+        status = server.take_failure()
+        if status:
+            self._send(status, b'stub error', 'text/plain')
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != '/sns/jscode2session':
+            self._send(404, b'not found', 'text/plain')
+            return
+        if self._inject('jscode2session'):
+            return
+        code = parse_qs(url.query).get('js_code', [''])[0]
+        body = json.dumps({
+            'openid': f'stub-{code}',
+            'session_key': hashlib.md5(code.encode('utf-8')).hexdigest(),
+        }).encode('utf-8')
+        self._send(200, body, 'application/json')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if urlsplit(self.path).path != '/pay/unifiedorder':
+            self._send(404, b'not found', 'text/plain')
+            return
+        if self._inject('unifiedorder'):
+            return
+        match = _OUT_TRADE_NO_RE.search(body)
+        out_trade_no = match.group(1) if match else b''
+        prepay_id = 'wx' + hashlib.md5(out_trade_no).hexdigest()
+        self._send(200, (
+            '<xml><return_code>SUCCESS</return_code>'
+            '<result_code>SUCCESS</result_code>'
+            f'<prepay_id>{prepay_id}</prepay_id></xml>'
+        ).encode('utf-8'), 'application/xml')
+
+
+class WechatStubServer(ThreadingHTTPServer):
+    """
+    微信桩服务
+    latency: 每个请求的延迟（秒）；error_rate: 随机返回 error_status 的比例；
+    fail_next: 接下来固定失败的请求数
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0,
+                 error_rate=0.0, error_status=503):
+        super().__init__((host, port), WechatStubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_next = 0
+        self.hits = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def handle_error(self, request, client_address):
+        # 注入延迟时客户端可能已超时断开，写响应失败属于预期情况
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def record(self, endpoint):
+        with self._lock:
+            self.hits[endpoint] += 1
+
+    def take_failure(self):
+        """本次请求应返回的错误状态码，不失败时返回 None"""
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return self.error_status
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status
+        return None
+
+    def start(self):
+        """在后台线程中启动"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
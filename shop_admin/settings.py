@@ -45,12 +45,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.metrics.MetricsMiddleware',
+    'shop.profiling.QueryAccountingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'shop.db_router.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'shop_admin.urls'
@@ -88,9 +91,27 @@ DATABASES = {
         'OPTIONS': {
             'charset': 'utf8mb4',
         },
-    }
+    },
+    # 只读副本示例（同时加入 DATABASE_REPLICAS）：
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.mysql',
+    #     'NAME': 'shop',
+    #     'USER': 'shop_ro',
+    #     'PASSWORD': '',
+    #     'HOST': '127.0.0.2',
+    #     'PORT': '3306',
+    #     'OPTIONS': {
+    #         'charset': 'utf8mb4',
+    #     },
+    # },
 }
 
+# 读写分离：只读接口的查询分配到以下副本连接，为空时全部走主库；
+# 用户写入/商品目录变更后 REPLICA_PIN_SECONDS 秒内仍读主库
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 10
+DATABASE_ROUTERS = ['shop.db_router.PrimaryReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -159,3 +180,95 @@ ALLOWED_HOSTS = [
 ]
 
 SITE_DOMAIN = "https://shop.kekouen.cn"
+
+# 缓存配置
+# 目录版本号、搜索索引的新鲜度校验和读写分离的钉住标记都依赖缓存在各 worker
+# 之间共享，因此使用 Redis；不能使用进程内的 LocMemCache（仅限单进程调试）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    }
+}
+
+# 商品目录缓存有效期（秒），目录变更时通过版本号立即失效
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# 微信接口配置（测试/压测时可指向本地桩服务）
+WECHAT_API_BASE = 'https://api.weixin.qq.com'
+WECHAT_PAY_API_BASE = 'https://api.mch.weixin.qq.com'
+WECHAT_HTTP_TIMEOUT = {
+    'connect': 2.0,
+    'read': 5.0,
+    'write': 5.0,
+    'pool': 3.0,
+}
+WECHAT_HTTP_MAX_CONNECTIONS = 100
+WECHAT_HTTP_MAX_KEEPALIVE = 20
+# 各接口单次请求总超时（秒）、最大重试次数、请求发出后是否可重试
+WECHAT_ENDPOINTS = {
+    'jscode2session': {'timeout': 3.0, 'retries': 2, 'idempotent': False},
+    'unifiedorder': {'timeout': 5.0, 'retries': 2, 'idempotent': True},
+}
+# 重试退避基数与上限（秒）
+WECHAT_RETRY_BACKOFF = 0.2
+WECHAT_RETRY_MAX_BACKOFF = 2.0
+# 微信支付商户配置（实际部署时应从环境变量读取）与 prepay_id 复用时长（秒）
+WECHAT_PAY_APPID = 'YOUR_WECHAT_APPID'
+WECHAT_PAY_MCH_ID = 'YOUR_MCH_ID'
+WECHAT_PAY_API_KEY = 'YOUR_API_KEY'
+WECHAT_PAY_NOTIFY_URL = 'http://your-domain.com/shop/wechat_pay_notify/'
+WECHAT_PREPAY_TTL = 110 * 60
+# 距订单超时取消不足该时长（秒）时不再发起支付
+WECHAT_PREPAY_MIN_TTL = 5 * 60
+# 熔断器：窗口内失败率达到阈值后打开，冷却后放行探测请求
+WECHAT_CIRCUIT_BREAKER = {
+    'failure_rate': 0.5,
+    'min_requests': 10,
+    'window': 30.0,
+    'reset_timeout': 30.0,
+}
+
+# 库存分片数（下单预占与待支付订单同时到期，见 ORDER_PENDING_TTL）
+STOCK_SHARDS = 8
+
+# 待支付订单超时取消（秒）、每批订单数、批次之间的暂停（秒）
+ORDER_PENDING_TTL = 60 * 60
+ORDER_EXPIRY_BATCH_SIZE = 500
+ORDER_EXPIRY_PAUSE = 0.1
+
+# 支付回调队列：最大处理次数、退避基数与上限（秒）、拉取后的占用时长（秒）
+PAYMENT_NOTIFY_MAX_ATTEMPTS = 8
+PAYMENT_NOTIFY_BACKOFF = 5
+PAYMENT_NOTIFY_MAX_BACKOFF = 10 * 60
+PAYMENT_NOTIFY_LEASE = 5 * 60
+
+# 商品标签主题（标签文字 -> 主题），未配置的标签使用 primary
+GOODS_TAG_THEMES = {}
+
+# 商品衍生图：名称 -> 最长边像素，以及编码质量、后台生成线程数、缓存时长（秒）
+GOODS_IMAGE_SIZES = {
+    'thumb': 300,
+    'list': 750,
+    'detail': 1500,
+}
+GOODS_IMAGE_QUALITY = 80
+GOODS_IMAGE_WORKERS = 2
+GOODS_IMAGE_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# 请求级 SQL 统计：Server-Timing 响应头、疑似 N+1 阈值（同一 SQL 重复次数）、
+# 慢请求阈值（秒）与记录采样率
+QUERY_ACCOUNTING_ENABLED = True
+SERVER_TIMING_HEADER = True
+QUERY_NPLUSONE_THRESHOLD = 5
+SLOW_REQUEST_THRESHOLD = 0.5
+SLOW_REQUEST_SAMPLE_RATE = 0.1
+
+# Prometheus 指标：gunicorn 多进程部署时设为各 worker 共享的目录（启动前清空），
+# 监控接口 /api/metrics/、/api/wechat-status/ 的访问令牌为空时不校验
+METRICS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# 热销榜时间窗口（名称 -> 小时数）与单次返回的最大商品数
+BEST_SELLER_WINDOWS = {'24h': 24, '7d': 24 * 7, '30d': 24 * 30}
+BEST_SELLERS_MAX_LIMIT = 50
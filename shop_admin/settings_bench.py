@@ -0,0 +1,38 @@
+"""
+基准测试配置：在本地 SQLite 上运行，用法
+DJANGO_SETTINGS_MODULE=shop_admin.settings_bench python manage.py bench_endpoints
+"""
+import os
+import tempfile
+
+from shop_admin.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'SHOP_BENCH_DB',
+            os.path.join(tempfile.gettempdir(), 'shop_bench.sqlite3')
+        ),
+        'OPTIONS': {
+            # 并发写入时等待锁而不是立即报错
+            'timeout': 30,
+        },
+    }
+}
+
+DATABASE_REPLICAS = []
+
+# 压测服务为单进程，使用进程内缓存，无需启动 Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# 压测时不输出慢请求日志，避免干扰结果报告
+SLOW_REQUEST_SAMPLE_RATE = 0